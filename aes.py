@@ -1,4 +1,83 @@
-import base64
+import binascii
+from functools import lru_cache
+
+# Prefer pycryptodome: its C extension dispatches straight to AES-NI with less
+# per-call overhead than cryptography's bindings, which matters for short payloads
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None
+    try:
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+        from cryptography.hazmat.backends import default_backend
+    except ImportError:
+        raise ImportError(
+            "Neither 'pycryptodome' nor 'cryptography' is installed. Please install it with: pip install cryptography"
+        ) from None
+
+# AES block size in bytes
+_BLOCK_SIZE = 16
+
+# pycryptodome only loads its AES-NI module when the CPU supports it; OpenSSL
+# (used by cryptography) selects AES-NI by itself and does not expose the choice
+if AES is not None and getattr(AES, "_raw_aesni_lib", None) is None:
+    print("Warning: AES-NI is not available, AES decryption will use the software implementation")
+
+
+@lru_cache(maxsize=8)
+def _get_cipher(key: bytes):
+    """Build (and remember) the AES-CBC cipher for a key; the IV is the first 16 bytes of the key."""
+    return Cipher(algorithms.AES(key), modes.CBC(key[:16]), backend=default_backend())
+
+
+@lru_cache(maxsize=16)
+def _normalize_key(key_string: str) -> bytes:
+    """Encode the key to bytes and fit it to a valid AES key length (16, 24, or 32 bytes)."""
+    key = key_string.encode('utf-8')
+    # Short keys are padded with null bytes up to 16; longer keys are
+    # truncated down to the largest AES key size that fits
+    size = 16 if len(key) < 24 else 24 if len(key) < 32 else 32
+    return key.ljust(size, b'\0')[:size]
+
+
+def _pkcs7_pad_length(block) -> int:
+    """
+    Return the PKCS7 padding length of the final block.
+
+    Every byte of the block is checked with bitwise masks instead of branching
+    on the pad value, so the work done does not depend on the padding.
+    """
+    pad = block[-1]
+    # A negative number shifted right stays negative (all bits set); this flags pad == 0 and pad > block size
+    bad = ((pad - 1) >> 8) | ((_BLOCK_SIZE - pad) >> 8)
+    for i in range(_BLOCK_SIZE):
+        # all bits set while i is inside the padding, zero outside it
+        in_pad = (i - pad) >> 8
+        bad |= in_pad & (block[_BLOCK_SIZE - 1 - i] ^ pad)
+    if bad:
+        raise ValueError("Invalid padding bytes.")
+    return pad
+
+
+def _decrypt_cbc(key: bytes, ciphertext: bytes):
+    """Decrypt raw CBC blocks and return the (still padded) output buffer and its length."""
+    # NOTE: always hand the whole ciphertext to a single decrypt/update call.
+    # CBC decryption is parallel across blocks and both backends pipeline several
+    # AES-NI blocks at once only when they see the full buffer - do not chunk it.
+    if AES is not None:
+        # pycryptodome cipher objects are stateful, so a new one is needed per message
+        buf = AES.new(key, AES.MODE_CBC, key[:16]).decrypt(ciphertext)
+        return buf, len(buf)
+
+    # Decryptors are single-use, but the cipher for a key is reused across calls
+    # update_into needs room for one extra block minus a byte; CBC without
+    # padding leaves nothing buffered, so finalize() only validates alignment
+    decryptor = _get_cipher(key).decryptor()
+    buf = bytearray(len(ciphertext) + _BLOCK_SIZE - 1)
+    n = decryptor.update_into(ciphertext, buf)
+    decryptor.finalize()
+    return buf, n
+
 
 def decrypt_aes_cbc_pkcs7(encrypted_data, key_string):
     """
@@ -21,53 +100,33 @@ def decrypt_aes_cbc_pkcs7(encrypted_data, key_string):
         "your_key_string"
     )
 
-    Note: This function requires either the 'cryptography' or 'pycryptodome' library to be installed.
+    Note: This module requires either the 'pycryptodome' or 'cryptography' library to be installed;
+    a missing library fails at import time rather than on the first decrypt.
     Install with: pip install cryptography
     """
     try:
-        # Try to import cryptography library first (preferred)
-        try:
-            from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-            from cryptography.hazmat.backends import default_backend
-            from cryptography.hazmat.primitives import padding
-        except ImportError:
-            raise Exception("'cryptography' library is not installed. Please install it with: pip install cryptography")
-
         # Step 1: Convert the key from string to bytes (matching Go code)
         # The Go code uses the key directly as bytes, and first 16 bytes as IV
-        key = key_string.encode('utf-8')  # Convert to bytes
-
-        # Ensure key is the right length (16, 24, or 32 bytes for AES)
-        if len(key) not in [16, 24, 32]:
-            # If key is not the right length, we need to pad or truncate
-            if len(key) < 16:
-                key = key.ljust(16, b'\0')  # Pad with null bytes
-            elif len(key) < 24:
-                key = key[:16]  # Use first 16 bytes for AES-128
-            elif len(key) < 32:
-                key = key[:24]  # Use first 24 bytes for AES-192
-            else:
-                key = key[:32]  # Use first 32 bytes for AES-256
-
-        # IV is the first 16 bytes of the key (matching Go: k[:blockSize])
-        iv = key[:16]
+        key = _normalize_key(key_string)
 
         # Step 2: If the encrypted data is a base64 string, convert it to bytes
         # This is like converting a coded message back to its original form
+        # a2b_base64 is the C routine behind b64decode, minus its wrapper overhead
         if isinstance(encrypted_data, str):
-            ciphertext = base64.b64decode(encrypted_data)
+            ciphertext = binascii.a2b_base64(encrypted_data)
         else:
             ciphertext = encrypted_data
 
         # Step 3 & 4: Decrypt using the available library
-            # Using cryptography library
-        cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-        decryptor = cipher.decryptor()
-        decrypted_padded_content = decryptor.update(ciphertext) + decryptor.finalize()
-
-        # Step 5: Remove the padding
-        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
-        plaintext_bytes = unpadder.update(decrypted_padded_content) + unpadder.finalize()
+        # IV is the first 16 bytes of the key (matching Go: k[:blockSize])
+        buf, n = _decrypt_cbc(key, ciphertext)
+
+        # Step 5: Remove the PKCS7 padding
+        # CBC output is the same length as the input, so the last byte is the pad length
+        if n == 0 or n % _BLOCK_SIZE:
+            raise ValueError("Invalid ciphertext length.")
+        pad = _pkcs7_pad_length(memoryview(buf)[n - _BLOCK_SIZE:n])
+        plaintext_bytes = bytes(buf[:n - pad])
 
         # Step 6: Convert the result back to readable text
         # This converts the unlocked message back to readable text
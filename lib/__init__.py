@@ -49,11 +49,11 @@ __all__ = [
     'Signer', 'SignOpts', 'ComponentData', 'RemapDef',
     
     # Webhook functions
-    'report_progress', 'report_certificate_status', 'report_profile_status',
+    'report_progress',
     'complete_job', 'fail_job', 'get_job_info', 'upload_signed_ipa',
     
     # Utility functions
-    'generate_bundle_id_from_email', 'rand_str', 'read_file',
+    'rand_str', 'read_file',
     
     # Security functions
     'security_import', 'security_remove_keychain',
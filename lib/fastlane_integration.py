@@ -6,24 +6,84 @@ This module handles all interactions with Fastlane for app registration,
 provisioning profile generation, and Apple Developer Portal operations.
 """
 
-from calendar import c
 import os
 import time
-import json
+import tempfile
+import base64
+import asyncio
+import selectors
+import itertools
+import re
 import subprocess
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
 from typing import Dict, Any, List, Set, Tuple, Optional
-from multiprocessing.pool import ThreadPool
-from .utils import run_process, clean_dev_portal_name, decode_clean
-from .webhooks import webhook_request, job_id
+from .utils import run_process, run_process_aio, clean_dev_portal_name, link_or_copy
+from . import webhooks
+from .webhooks import webhook_request, json_loads, report_progress, get_certificate_from_server, upload_certificate
 from .security import security_import
 
+ICLOUD_ENTITLEMENTS = (
+    "com.apple.developer.icloud-container-development-container-identifiers",
+    "com.apple.developer.icloud-container-identifiers",
+    "com.apple.developer.ubiquity-container-identifiers",
+    "com.apple.developer.ubiquity-kvstore-identifier",
+)
+
+GROUP_ENTITLEMENTS = ("com.apple.security.application-groups",)
+
+# App extras as (fastlane produce type, id prefix, entitlements listing the ids)
+APP_EXTRAS = (("cloud_container", "iCloud.", ICLOUD_ENTITLEMENTS), ("group", "group.", GROUP_ENTITLEMENTS))
+
+# Maximum number of fastlane processes run at once when registering app extras
+FASTLANE_MAX_CONCURRENCY = 8
+
+# Printed by fastlane spaceauth when it needs a two-factor authentication code: the trusted
+# device and SMS prompts ("Please enter the 6 digit code[ you received at +1 ...]:"), and the
+# banner older and newer versions print before asking
+TWO_FACTOR_PROMPT = re.compile(
+    rb"enter the \d+ digit code|Two-factor Authentication \(\d+ digits\)|Two-step Verification", re.IGNORECASE
+)
+
+# Seconds to wait for a recognized 2FA prompt before asking the server for a code anyway, in case
+# fastlane words its prompt in a way TWO_FACTOR_PROMPT doesn't know
+TWO_FACTOR_FALLBACK_DELAY = 10
+
+# Maps entitlements to the fastlane produce flags of the services they need
+ENTITLEMENT_SERVICE_FLAGS: MappingProxyType = MappingProxyType({
+    "aps-environment": ("--push-notification",),  # iOS
+    "com.apple.developer.aps-environment": ("--push-notification",),  # macOS
+    "com.apple.developer.healthkit": ("--health-kit",),
+    "com.apple.developer.homekit": ("--home-kit",),
+    "com.apple.external-accessory.wireless-configuration": ("--wireless-accessory",),
+    "inter-app-audio": ("--inter-app-audio",),
+    "com.apple.developer.kernel.extended-virtual-addressing": ("--extended-virtual-address-space",),
+    "com.apple.developer.networking.multipath": ("--multipath",),
+    "com.apple.developer.networking.networkextension": ("--network-extension",),
+    "com.apple.developer.networking.vpn.api": ("--personal-vpn",),
+    "com.apple.developer.networking.wifi-info": ("--access-wifi",),
+    "com.apple.developer.nfc.readersession.formats": ("--nfc-tag-reading",),
+    "com.apple.developer.siri": ("--siri-kit",),
+    "com.apple.developer.associated-domains": ("--associated-domains",),
+    **{k: ("--icloud", "xcode6_compatible") for k in ICLOUD_ENTITLEMENTS},
+    **{k: ("--app-group",) for k in GROUP_ENTITLEMENTS},
+})
+
+@lru_cache(maxsize=8)
+def _build_fastlane_env(account_name: str, account_pass: str, team_id: str) -> Dict[str, str]:
+    """Build the environment for fastlane calls once per account; callers must not mutate it."""
+    return {
+        **os.environ,
+        "FASTLANE_USER": account_name,
+        "FASTLANE_PASSWORD": account_pass,
+        "FASTLANE_TEAM_ID": team_id,
+    }
+
+
 def fastlane_auth(account_name: str, account_pass: str, team_id: str):
     """Authenticate with Apple Developer Portal using Fastlane."""
-    my_env = os.environ.copy()
-    my_env["FASTLANE_USER"] = account_name
-    my_env["FASTLANE_PASSWORD"] = account_pass
-    my_env["FASTLANE_TEAM_ID"] = team_id
+    my_env = _build_fastlane_env(account_name, account_pass, team_id)
 
     auth_pipe = subprocess.Popen(
         # enable copy to clipboard so we're not interactively prompted
@@ -32,51 +92,89 @@ def fastlane_auth(account_name: str, account_pass: str, team_id: str):
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         env=my_env,
+        close_fds=False,
     )
 
+    # Watch fastlane's output and only ask the server for a 2FA code once
+    # fastlane actually prompts for one
+    sel = selectors.DefaultSelector()
+    output = {auth_pipe.stdout: b"", auth_pipe.stderr: b""}
+    unscanned = b""  # output received since the last 2FA code was submitted
+    for pipe in output:
+        sel.register(pipe, selectors.EVENT_READ)
+
     start_time = time.time()
-    while True:
-        if time.time() - start_time > 60:
-            raise Exception("Operation timed out")
-        else:
+    next_2fa_check = 0.0
+    waiting_for_2fa = False
+    try:
+        while True:
+            if time.time() - start_time > 60:
+                auth_pipe.kill()
+                raise Exception("Operation timed out")
+
+            for key, _ in sel.select(timeout=0.5):
+                chunk = os.read(key.fd, 4096)
+                if not chunk:
+                    sel.unregister(key.fileobj)
+                    continue
+                output[key.fileobj] += chunk
+                unscanned += chunk
+                if not waiting_for_2fa and TWO_FACTOR_PROMPT.search(unscanned):
+                    print("Waiting for 2FA code from server...")
+                    waiting_for_2fa = True
+
+            # still no recognized prompt: ask the server anyway, as before prompts were watched for
+            fallback_due = time.time() - start_time > TWO_FACTOR_FALLBACK_DELAY
+            if not waiting_for_2fa and not auth_pipe.stdin.closed and fallback_due:
+                print("No 2FA prompt recognized yet, waiting for 2FA code from server anyway...")
+                waiting_for_2fa = True
+
             result = auth_pipe.poll()
             if result == 0:
                 print("Logged in!")
                 break
             elif result is not None:
-                stdout, stderr = auth_pipe.communicate()
-                result = {"error_code": result, "stdout": stdout, "stderr": stderr}
+                for key in list(sel.get_map().values()):
+                    output[key.fileobj] += key.fileobj.read()
+                result = {"error_code": result, "stdout": output[auth_pipe.stdout], "stderr": output[auth_pipe.stderr]}
                 raise Exception(f"Error logging in: {result}")
 
+            if not waiting_for_2fa or time.time() < next_2fa_check:
+                continue
+            next_2fa_check = time.time() + 2
+
             # Try to get 2FA code from server
             try:
-                result = webhook_request("job/2fa", {"job_id": job_id}, check=False)
+                result = webhook_request("job/2fa", {"job_id": webhooks.job_id}, check=False)
                 if result.returncode == 0:
-                    response_data = json.loads(decode_clean(result.stdout))
+                    response_data = json_loads(result.stdout)
                     if response_data.get("code") == 1 and response_data.get("data", {}).get("two_factor_code"):
                         account_2fa = response_data["data"]["two_factor_code"]
-                        auth_pipe.communicate((account_2fa + "\n").encode())
+                        auth_pipe.stdin.write((account_2fa + "\n").encode())
+                        auth_pipe.stdin.close()
+                        waiting_for_2fa = False
+                        unscanned = b""
                         print(f"Used 2FA code from server: {account_2fa}")
-                        continue
             except Exception as e:
                 print(f"Failed to get 2FA from server: {e}")
+    finally:
+        sel.close()
+        for pipe in (auth_pipe.stdin, auth_pipe.stdout, auth_pipe.stderr):
+            pipe.close()
 
-            # If no 2FA available, wait a bit and try again
-            print("Waiting for 2FA code from server...")
-        time.sleep(2)
 
+def _reprefix(id: str, prefix: str) -> str:
+    """Replace the first dot-separated component of an id with the given prefix, unless it already has it."""
+    if id.startswith(prefix):
+        return id
+    _, sep, tail = id.partition(".")
+    if not sep:
+        raise Exception(f"Cannot re-prefix '{id}' with '{prefix}': it has no '.' separator")
+    return prefix + tail
 
-def fastlane_register_app_extras(
-    my_env: Dict[Any, Any],
-    bundle_id: str,
-    extra_type: str,
-    extra_prefix: str,
-    matchable_entitlements: List[str],
-    entitlements: Dict[Any, Any],
-):
-    """Register app extras (groups, iCloud containers) with Apple Developer Portal."""
-    from .utils import run_process_async, popen_check
 
+def _extra_ids(extra_prefix: str, matchable_entitlements: Tuple[str, ...], entitlements: Dict[Any, Any]) -> Set[str]:
+    """Get the app extra ids (groups, iCloud containers) an app's entitlements refer to."""
     matched_ids: Set[str] = set()
     for k, v in entitlements.items():
         if k in matchable_entitlements:
@@ -89,15 +187,16 @@ def fastlane_register_app_extras(
 
     # ensure all ids are prefixed correctly or registration will fail
     # some matchable entitlements are incorrectly prefixed with team id
-    matched_ids = set(
-        id if id.startswith(extra_prefix) else extra_prefix + id[id.index(".") + 1 :] for id in matched_ids
-    )
+    return {_reprefix(id, extra_prefix) for id in matched_ids}
 
-    jobs: List[subprocess.Popen] = []
 
-    for id in matched_ids:
-        jobs.append(
-            run_process_async(
+async def fastlane_create_app_extras(my_env: Dict[Any, Any], extra_type: str, ids: Set[str], limit: asyncio.Semaphore):
+    """Create app extras (groups, iCloud containers) with Apple Developer Portal."""
+    # each id must be created by one process only: fastlane checks for an existing id before
+    # creating it, so two concurrent creations of the same id race and one fails
+    await asyncio.gather(
+        *(
+            run_process_aio(
                 "fastlane",
                 "produce",
                 extra_type,
@@ -107,38 +206,45 @@ def fastlane_register_app_extras(
                 "-n",
                 clean_dev_portal_name(f"ST {id}"),
                 env=my_env,
+                close_fds=False,
+                limit=limit,
             )
+            for id in ids
         )
+    )
 
-    for pipe in jobs:
-        if pipe.poll() is None:
-            pipe.wait()
-        popen_check(pipe)
 
-    run_process(
+async def fastlane_associate_app_extras(
+    my_env: Dict[Any, Any], bundle_id: str, extra_type: str, ids: Set[str], limit: asyncio.Semaphore
+):
+    """Associate already created app extras (groups, iCloud containers) with an app."""
+    await run_process_aio(
         "fastlane",
         "produce",
         f"associate_{extra_type}",
         "--skip_itc",
         "--app_identifier",
         bundle_id,
-        *matched_ids,
+        *ids,
         env=my_env,
+        close_fds=False,
+        limit=limit,
     )
 
 
-def fastlane_register_app(
-    account_name: str, account_pass: str, team_id: str, bundle_id: str, entitlements: Dict[Any, Any]
+async def _fastlane_register_app_aio(
+    my_env: Dict[Any, Any],
+    bundle_id: str,
+    entitlements: Dict[Any, Any],
+    limit: asyncio.Semaphore,
 ):
-    """Register app with Apple Developer Portal and configure services."""
-
-    my_env = os.environ.copy()
-    my_env["FASTLANE_USER"] = account_name
-    my_env["FASTLANE_PASSWORD"] = account_pass
-    my_env["FASTLANE_TEAM_ID"] = team_id
+    """
+    Register a single app and configure its services, sharing the fastlane process limit.
 
+    The app's extras are associated with it at the end; they must have been created already.
+    """
     # no-op if already exists
-    run_process(
+    await run_process_aio(
         "fastlane",
         "produce",
         "create",
@@ -148,8 +254,14 @@ def fastlane_register_app(
         "--app-name",
         clean_dev_portal_name(f"ST {bundle_id}"),
         env=my_env,
+        close_fds=False,
+        limit=limit,
     )
 
+    service_flags = list(dict.fromkeys(
+        itertools.chain.from_iterable(ENTITLEMENT_SERVICE_FLAGS[f] for f in entitlements if f in ENTITLEMENT_SERVICE_FLAGS)
+    ))
+
     supported_services = [
         "--push-notification",
         "--health-kit",
@@ -169,7 +281,7 @@ def fastlane_register_app(
     ]
 
     # clear any previous services
-    run_process(
+    await run_process_aio(
         "fastlane",
         "produce",
         "disable_services",
@@ -178,44 +290,13 @@ def fastlane_register_app(
         bundle_id,
         *supported_services,
         env=my_env,
+        close_fds=False,
+        limit=limit,
     )
 
-    icloud_entitlements = [
-        "com.apple.developer.icloud-container-development-container-identifiers",
-        "com.apple.developer.icloud-container-identifiers",
-        "com.apple.developer.ubiquity-container-identifiers",
-        "com.apple.developer.ubiquity-kvstore-identifier",
-    ]
-
-    group_entitlements = ["com.apple.security.application-groups"]
-
-    entitlement_map: Dict[str, Tuple[str, ...]] = {
-        "aps-environment": tuple(["--push-notification"]),  # iOS
-        "com.apple.developer.aps-environment": tuple(["--push-notification"]),  # macOS
-        "com.apple.developer.healthkit": tuple(["--health-kit"]),
-        "com.apple.developer.homekit": tuple(["--home-kit"]),
-        "com.apple.external-accessory.wireless-configuration": tuple(["--wireless-accessory"]),
-        "inter-app-audio": tuple(["--inter-app-audio"]),
-        "com.apple.developer.kernel.extended-virtual-addressing": tuple(["--extended-virtual-address-space"]),
-        "com.apple.developer.networking.multipath": tuple(["--multipath"]),
-        "com.apple.developer.networking.networkextension": tuple(["--network-extension"]),
-        "com.apple.developer.networking.vpn.api": tuple(["--personal-vpn"]),
-        "com.apple.developer.networking.wifi-info": tuple(["--access-wifi"]),
-        "com.apple.developer.nfc.readersession.formats": tuple(["--nfc-tag-reading"]),
-        "com.apple.developer.siri": tuple(["--siri-kit"]),
-        "com.apple.developer.associated-domains": tuple(["--associated-domains"]),
-    }
-    for k in icloud_entitlements:
-        entitlement_map[k] = tuple(["--icloud", "xcode6_compatible"])
-    for k in group_entitlements:
-        entitlement_map[k] = tuple(["--app-group"])
-
-    service_flags = set(entitlement_map[f] for f in entitlements.keys() if f in entitlement_map)
-    service_flags = [item for sublist in service_flags for item in sublist]
-
     print("Enabling services:", service_flags)
 
-    run_process(
+    await run_process_aio(
         "fastlane",
         "produce",
         "enable_services",
@@ -224,53 +305,117 @@ def fastlane_register_app(
         bundle_id,
         *service_flags,
         env=my_env,
+        close_fds=False,
+        limit=limit,
     )
 
-    app_extras = [("cloud_container", "iCloud.", icloud_entitlements), ("group", "group.", group_entitlements)]
-    with ThreadPool(len(app_extras)) as p:
-        p.starmap(
-            lambda extra_type, extra_prefix, matchable_entitlements: fastlane_register_app_extras(
-                my_env, bundle_id, extra_type, extra_prefix, matchable_entitlements, entitlements
-            ),
-            app_extras,
+    await asyncio.gather(
+        *(
+            fastlane_associate_app_extras(
+                my_env, bundle_id, extra_type, _extra_ids(extra_prefix, matchable_entitlements, entitlements), limit
+            )
+            for extra_type, extra_prefix, matchable_entitlements in APP_EXTRAS
+        )
+    )
+
+
+def fastlane_register_apps(
+    account_name: str, account_pass: str, team_id: str, apps: List[Tuple[str, Dict[Any, Any]]]
+):
+    """
+    Register several apps with Apple Developer Portal and configure their services.
+
+    The apps are registered concurrently, so the fastlane start-up time of each
+    registration overlaps with the others. App extras are often shared between apps
+    (remapped ids give every component the same group), so each one is created once,
+    before any app is registered. If a bundle id is listed more than once, the last
+    entitlements given for it are used.
+    """
+    my_env = _build_fastlane_env(account_name, account_pass, team_id)
+    apps_by_id = dict(apps)
+
+    async def register_all():
+        limit = asyncio.Semaphore(FASTLANE_MAX_CONCURRENCY)
+        await asyncio.gather(
+            *(
+                fastlane_create_app_extras(
+                    my_env,
+                    extra_type,
+                    set().union(*(_extra_ids(extra_prefix, matchable, e) for e in apps_by_id.values())),
+                    limit,
+                )
+                for extra_type, extra_prefix, matchable in APP_EXTRAS
+            )
         )
+        await asyncio.gather(
+            *(
+                _fastlane_register_app_aio(my_env, bundle_id, entitlements, limit)
+                for bundle_id, entitlements in apps_by_id.items()
+            )
+        )
+
+    asyncio.run(register_all())
+
+
+def fastlane_register_app(
+    account_name: str, account_pass: str, team_id: str, bundle_id: str, entitlements: Dict[Any, Any]
+):
+    """Register app with Apple Developer Portal and configure services."""
+    fastlane_register_apps(account_name, account_pass, team_id, [(bundle_id, entitlements)])
+
+
+def fastlane_get_prov_profiles(
+    account_name: str, account_pass: str, team_id: str, profiles: List[Tuple[str, Path]], prov_type: str, platform: str
+):
+    """
+    Generate provisioning profiles for several bundle ids concurrently using Fastlane.
+
+    Each profile is written to every output file listed for its bundle id.
+    """
+    my_env = _build_fastlane_env(account_name, account_pass, team_id)
+    out_files: Dict[str, List[Path]] = {}
+    for bundle_id, out_file in profiles:
+        out_files.setdefault(bundle_id, []).append(out_file)
+
+    async def get_profile(bundle_id: str, limit: asyncio.Semaphore):
+        with tempfile.TemporaryDirectory() as tmpdir_str:
+            await run_process_aio(
+                "fastlane",
+                "sigh",
+                "renew",
+                "--app_identifier",
+                bundle_id,
+                "--provisioning_name",
+                clean_dev_portal_name(f"ST {bundle_id} {prov_type}"),
+                "--force",
+                "--skip_install",
+                "--include_mac_in_profiles",
+                "--platform",
+                platform,
+                "--" + prov_type,
+                "--output_path",
+                tmpdir_str,
+                "--filename",
+                "prov.mobileprovision",
+                env=my_env,
+                close_fds=False,
+                limit=limit,
+            )
+            for out_file in out_files[bundle_id]:
+                link_or_copy(Path(tmpdir_str).joinpath("prov.mobileprovision"), out_file)
+
+    async def get_all():
+        limit = asyncio.Semaphore(FASTLANE_MAX_CONCURRENCY)
+        await asyncio.gather(*(get_profile(bundle_id, limit) for bundle_id in out_files))
+
+    asyncio.run(get_all())
 
 
 def fastlane_get_prov_profile(
     account_name: str, account_pass: str, team_id: str, bundle_id: str, prov_type: str, platform: str, out_file: Path
 ):
     """Generate provisioning profile using Fastlane."""
-    import tempfile
-    import shutil
-    from .webhooks import report_progress
-
-    my_env = os.environ.copy()
-    my_env["FASTLANE_USER"] = account_name
-    my_env["FASTLANE_PASSWORD"] = account_pass
-    my_env["FASTLANE_TEAM_ID"] = team_id
-
-    with tempfile.TemporaryDirectory() as tmpdir_str:
-        run_process(
-            "fastlane",
-            "sigh",
-            "renew",
-            "--app_identifier",
-            bundle_id,
-            "--provisioning_name",
-            clean_dev_portal_name(f"ST {bundle_id} {prov_type}"),
-            "--force",
-            "--skip_install",
-            "--include_mac_in_profiles",
-            "--platform",
-            platform,
-            "--" + prov_type,
-            "--output_path",
-            tmpdir_str,
-            "--filename",
-            "prov.mobileprovision",
-            env=my_env,
-        )
-        shutil.copy2(Path(tmpdir_str).joinpath("prov.mobileprovision"), out_file)
+    fastlane_get_prov_profiles(account_name, account_pass, team_id, [(bundle_id, out_file)], prov_type, platform)
 
 
 def fastlane_get_certificate(
@@ -295,11 +440,6 @@ def fastlane_get_certificate(
     Returns:
         Path to certificate file or None if failed
     """
-    import tempfile
-    import shutil
-    import base64
-    from .webhooks import get_certificate_from_server, upload_certificate, report_progress
-
     # tmpdir = Path(tmpdir_str)
     current_directory = os.getcwd()
     tmpdir = Path(current_directory + "/tmp")
@@ -326,10 +466,7 @@ def fastlane_get_certificate(
     print("Generating new certificate with Fastlane")
     report_progress(31, "Generating new certificate (this may take a moment)")
 
-    my_env = os.environ.copy()
-    my_env["FASTLANE_USER"] = account_name
-    my_env["FASTLANE_PASSWORD"] = account_pass
-    my_env["FASTLANE_TEAM_ID"] = team_id
+    my_env = _build_fastlane_env(account_name, account_pass, team_id)
 
     with tempfile.TemporaryDirectory() as tmpdir_str:
         try:
@@ -349,6 +486,7 @@ def fastlane_get_certificate(
                 "--filename",
                 "cert.p12",
                 env=my_env,
+                close_fds=False,
             )
 
             # Fastlane creates THREE files:
@@ -396,10 +534,8 @@ def fastlane_get_certificate(
                 "-passout", f"pass:{cert_pass}",
             )
 
-            # Read and encode certificate
-            with open(actual_cert_path, 'rb') as f:
-                cert_bytes = f.read()
-                cert_data_encoded = base64.b64encode(cert_bytes).decode('utf-8')
+            # Read and encode certificate; base64 output is pure ASCII
+            cert_data_encoded = base64.b64encode(actual_cert_path.read_bytes()).decode('ascii')
 
             report_progress(33, "Certificate generated, uploading to server")
 
@@ -436,8 +572,6 @@ def fastlane_register_device(
     be included in development provisioning profiles. Think of it like adding someone's
     name to a guest list before sending them an invitation!
     """
-    from .webhooks import report_progress
-
     # Generate a friendly device name if not provided
     # Using first 8 characters of UDID to make it recognizable
     if device_name is None:
@@ -446,10 +580,7 @@ def fastlane_register_device(
     print(f"Registering device: {device_name} (UDID: {device_udid})")
     report_progress(40, f"Registering device with Apple")
 
-    my_env = os.environ.copy()
-    my_env["FASTLANE_USER"] = account_name
-    my_env["FASTLANE_PASSWORD"] = account_pass
-    my_env["FASTLANE_TEAM_ID"] = team_id
+    my_env = _build_fastlane_env(account_name, account_pass, team_id)
 
     try:
         # Register the device using Fastlane
@@ -462,6 +593,7 @@ def fastlane_register_device(
             f"udid:{device_udid}",
             f"name:{clean_dev_portal_name(device_name)}",
             env=my_env,
+            close_fds=False,
         )
 
         print(f"✓ Device registered successfully: {device_name}")
@@ -7,22 +7,36 @@ certificate importing, and provisioning profile operations.
 """
 
 import re
+import copy
+import plistlib
+import struct
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from .utils import run_process, decode_clean, plist_loads
 
-def security_get_keychain_list():
+try:
+    from asn1crypto import cms
+except ImportError:
+    cms = None
+
+# Quoted identity names in `security find-identity` output
+_IDENTITY_RE = re.compile(r'"([^"]+)"')
+
+# Mach-O code signature layout, see xnu's loader.h and cs_blobs.h
+_LC_CODE_SIGNATURE = 0x1D
+_CSMAGIC_EMBEDDED_SIGNATURE = 0xFADE0CC0
+_CSMAGIC_EMBEDDED_ENTITLEMENTS = 0xFADE7171
+_CSSLOT_ENTITLEMENTS = 5
+
+def security_get_keychain_list() -> List[str]:
     """Get list of user keychains."""
-    return map(
-        lambda x: x.strip('"'),
-        decode_clean(run_process("security", "list-keychains", "-d", "user").stdout).split(),
-    )
+    return [k.strip('"') for k in decode_clean(run_process("security", "list-keychains", "-d", "user").stdout).split()]
 
 
 def security_remove_keychain(keychain: str):
     """Remove a keychain from the system."""
-    keychains = security_get_keychain_list()
-    keychains = filter(lambda x: keychain not in x, keychains)
+    keychains = [k for k in security_get_keychain_list() if keychain not in k]
     run_process("security", "list-keychains", "-d", "user", "-s", *keychains)
     run_process("security", "delete-keychain", keychain)
 
@@ -60,18 +74,32 @@ def security_import(cert: str, cert_pass: str, keychain: str) -> List[str]:
     )
 
     identity: str = decode_clean(run_process("security", "find-identity", "-p", "appleID", "-v", created_keychain).stdout)
-    return [line.strip('"') for line in re.findall('".*"', identity)]
+    return _IDENTITY_RE.findall(identity)
+
+
+def security_dump_prov(f: Path) -> bytes:
+    """Dump provisioning profile plist bytes, decoding the CMS envelope in-process when asn1crypto is available."""
+    if cms is not None:
+        try:
+            content_info = cms.ContentInfo.load(f.read_bytes())
+            return content_info["content"]["encap_content_info"]["content"].native
+        except Exception as e:
+            print(f"Failed to decode provisioning profile in-process, falling back to security: {e}")
+    return run_process("security", "cms", "-D", "-i", str(f)).stdout
 
 
-def security_dump_prov(f: Path):
-    """Dump provisioning profile using security command."""
-    return decode_clean(run_process("security", "cms", "-D", "-i", str(f)).stdout)
+@lru_cache(maxsize=32)
+def _dump_prov_cached(prov_path: str, mtime_ns: int, size: int) -> Dict[Any, Any]:
+    """Parse a provisioning profile, cached by its path and stat identity."""
+    # plistlib parses the raw bytes directly, no need to decode to str first
+    return plistlib.loads(security_dump_prov(Path(prov_path)))
 
 
 def dump_prov(prov_file: Path) -> Dict[Any, Any]:
     """Parse provisioning profile and return as dictionary."""
-    s = security_dump_prov(prov_file)
-    return plist_loads(s)
+    st = prov_file.stat()
+    # callers modify the result (e.g. entitlements), so never hand out the cached dict
+    return copy.deepcopy(_dump_prov_cached(str(prov_file), st.st_mtime_ns, st.st_size))
 
 
 def dump_prov_entitlements(prov_file: Path) -> Dict[Any, Any]:
@@ -81,17 +109,87 @@ def dump_prov_entitlements(prov_file: Path) -> Dict[Any, Any]:
 
 def codesign_async(identity: str, component: Path, entitlements: Path = None):
     """Start codesign process asynchronously."""
+    return codesign_batch_async(identity, [component], entitlements)
+
+
+def codesign_batch_async(identity: str, components: List[Path], entitlements: Path = None):
+    """Start a single codesign process for several components sharing the same signing arguments."""
     from .utils import run_process_async
 
     cmd = ["codesign", "--continue", "-f", "--no-strict", "-s", identity]
     if entitlements:
         cmd.extend(["--entitlements", str(entitlements)])
-    return run_process_async(*cmd, str(component))
-
-
-def codesign_dump_entitlements(component: Path) -> Dict[Any, Any]:
-    """Dump entitlements from signed component."""
-    entitlements_str = decode_clean(
-        run_process("codesign", "--no-strict", "-d", "--entitlements", "-", "--xml", str(component)).stdout
-    )
-    return plist_loads(entitlements_str)
+    return run_process_async(*cmd, *map(str, components))
+
+
+def read_embedded_entitlements(binary: Path) -> Optional[Dict[Any, Any]]:
+    """
+    Read the entitlements plist from a Mach-O binary's code signature without running codesign.
+
+    Fat binaries are read from their first slice. Returns None when the binary has no
+    signature or the signature carries no XML entitlements.
+    """
+    with open(binary, "rb") as f:
+        base = 0
+        magic = f.read(4)
+        if magic in (b"\xca\xfe\xba\xbe", b"\xca\xfe\xba\xbf"):
+            nfat_arch = struct.unpack(">I", f.read(4))[0]
+            if nfat_arch == 0:
+                return None
+            if magic == b"\xca\xfe\xba\xbe":
+                base = struct.unpack(">8xI8x", f.read(20))[0]
+            else:
+                base = struct.unpack(">8xQ16x", f.read(32))[0]
+            f.seek(base)
+            magic = f.read(4)
+        if magic in (b"\xce\xfa\xed\xfe", b"\xcf\xfa\xed\xfe"):
+            endian = "<"
+        elif magic in (b"\xfe\xed\xfa\xce", b"\xfe\xed\xfa\xcf"):
+            endian = ">"
+        else:
+            raise Exception(binary, "is not a Mach-O binary")
+        ncmds, sizeofcmds = struct.unpack(endian + "12xII4x", f.read(24))
+        # the 64-bit header has an extra reserved field before the load commands
+        if magic in (b"\xcf\xfa\xed\xfe", b"\xfe\xed\xfa\xcf"):
+            f.read(4)
+        cmds = f.read(sizeofcmds)
+
+        offset = 0
+        for _ in range(ncmds):
+            cmd, cmdsize = struct.unpack_from(endian + "II", cmds, offset)
+            if cmd == _LC_CODE_SIGNATURE:
+                dataoff, datasize = struct.unpack_from(endian + "II", cmds, offset + 8)
+                break
+            offset += cmdsize
+        else:
+            return None
+
+        f.seek(base + dataoff)
+        blob = f.read(datasize)
+
+    # the signature superblob is always big-endian
+    magic, _, count = struct.unpack_from(">III", blob)
+    if magic != _CSMAGIC_EMBEDDED_SIGNATURE:
+        return None
+    for i in range(count):
+        slot, slot_offset = struct.unpack_from(">II", blob, 12 + i * 8)
+        if slot == _CSSLOT_ENTITLEMENTS:
+            magic, length = struct.unpack_from(">II", blob, slot_offset)
+            if magic != _CSMAGIC_EMBEDDED_ENTITLEMENTS:
+                return None
+            return plistlib.loads(blob[slot_offset + 8:slot_offset + length])
+    return None
+
+
+def codesign_dump_entitlements(component: Path, executable: Optional[Path] = None) -> Dict[Any, Any]:
+    """Dump entitlements from signed component, reading them from its executable directly when given."""
+    if executable is not None and executable.is_file():
+        try:
+            entitlements = read_embedded_entitlements(executable)
+            if entitlements is not None:
+                return entitlements
+        except Exception as e:
+            print(f"Could not read embedded entitlements of {executable.name}, falling back to codesign: {e}")
+    # plistlib takes the bytes as they are, no need to decode them first
+    entitlements = run_process("codesign", "--no-strict", "-d", "--entitlements", "-", "--xml", str(component)).stdout
+    return plist_loads(entitlements.strip())
@@ -6,23 +6,72 @@ This module contains the core signing functionality including the Signer class
 that orchestrates the entire app signing process.
 """
 
-import copy
 import os
-import re
+import plistlib
 import shutil
-import subprocess
 import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, NamedTuple, Set, Tuple, Any, Optional
 
 from .utils import (
-    safe_glob, plist_load, plist_dump, print_object,
-    get_info_plist_path, get_main_app_path, rand_str, binary_replace, get_app_type
+    walk_components, plist_load, plist_dump, print_object,
+    get_info_plist_path, get_main_app_path, rand_str, binary_replace_all, get_app_type, link_or_copy
 )
-from .security import codesign_async, codesign_dump_entitlements, dump_prov_entitlements, security_import
-from .fastlane_integration import fastlane_auth, fastlane_register_app, fastlane_get_prov_profile, fastlane_get_certificate, fastlane_register_device
+from .security import codesign_async, codesign_batch_async, codesign_dump_entitlements, dump_prov_entitlements, security_import
+from .fastlane_integration import fastlane_auth, fastlane_register_apps, fastlane_get_prov_profiles, fastlane_get_certificate, fastlane_register_device
 from .webhooks import report_progress
 
+# Maximum number of components signed at once; codesign is subprocess and I/O bound
+SIGN_MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# Entitlements kept when generating entitlements, besides the platform-specific
+# application identifier and push environment keys
+_SUPPORTED_ENTITLEMENTS = frozenset([
+    "com.apple.developer.team-identifier",
+    "com.apple.developer.healthkit",
+    "com.apple.developer.healthkit.access",
+    "com.apple.developer.homekit",
+    "com.apple.external-accessory.wireless-configuration",
+    "com.apple.security.application-groups",
+    "inter-app-audio",
+    "get-task-allow",
+    "keychain-access-groups",
+    "com.apple.developer.icloud-container-development-container-identifiers",
+    "com.apple.developer.icloud-container-environment",
+    "com.apple.developer.icloud-container-identifiers",
+    "com.apple.developer.icloud-services",
+    "com.apple.developer.kernel.extended-virtual-addressing",
+    "com.apple.developer.networking.multipath",
+    "com.apple.developer.networking.networkextension",
+    "com.apple.developer.networking.vpn.api",
+    "com.apple.developer.networking.wifi-info",
+    "com.apple.developer.nfc.readersession.formats",
+    "com.apple.developer.siri",
+    "com.apple.developer.ubiquity-container-identifiers",
+    "com.apple.developer.ubiquity-kvstore-identifier",
+    "com.apple.developer.associated-domains",
+    # macOS only
+    "com.apple.security.app-sandbox",
+    "com.apple.security.assets.pictures.read-write",
+    "com.apple.security.cs.allow-jit",
+    "com.apple.security.cs.allow-unsigned-executable-memory",
+    "com.apple.security.cs.disable-library-validation",
+    "com.apple.security.device.audio-input",
+    "com.apple.security.device.bluetooth",
+    "com.apple.security.device.usb",
+    "com.apple.security.files.user-selected.read-only",
+    "com.apple.security.files.user-selected.read-write",
+    "com.apple.security.network.client",
+    "com.apple.security.network.server",
+])
+_SUPPORTED_ENTITLEMENTS_IOS = _SUPPORTED_ENTITLEMENTS | {"application-identifier", "aps-environment"}
+_SUPPORTED_ENTITLEMENTS_MAC = _SUPPORTED_ENTITLEMENTS | {
+    "com.apple.application-identifier",
+    "com.apple.developer.aps-environment",
+}
+
 class SignOpts(NamedTuple):
     """Configuration options for the signing process."""
     app_dir: Path
@@ -53,6 +102,100 @@ class RemapDef(NamedTuple):
     is_list: bool
 
 
+# Entitlement ids remapped when encoding ids, as (entitlements, prefix, prefix_only, is_list);
+# the prefix is formatted with the team id
+_REMAP_TEMPLATES = (
+    (["com.apple.security.application-groups"], "group.", False, True),
+    (
+        [
+            "com.apple.developer.icloud-container-identifiers",
+            "com.apple.developer.ubiquity-container-identifiers",
+            "com.apple.developer.icloud-container-development-container-identifiers",
+        ],
+        "iCloud.",
+        False,
+        True,
+    ),
+    (["keychain-access-groups"], "{team_id}.", True, True),
+    (["com.apple.developer.ubiquity-kvstore-identifier"], "{team_id}.", False, False),
+)
+
+# Map extension point identifiers to bundle ID suffixes
+# Comprehensive list of iOS/iPadOS/watchOS extension types
+_EXTENSION_BUNDLE_SUFFIXES = {
+    # Widget Extensions
+    "com.apple.widgetkit-extension": ".widgetkit",
+    "com.apple.widget-extension": ".widgetkit",  # Legacy widget
+    "com.apple.today-widget": ".todaywidget",
+    "com.apple.glance-widget": ".glancewidget",  # watchOS
+
+    # Notification Extensions
+    "com.apple.usernotifications.service": ".notificationservice",
+    "com.apple.usernotifications.content-extension": ".notificationcontent",
+
+    # Share & Action Extensions
+    "com.apple.share-services": ".shareextension",
+    "com.apple.ui-services": ".actionextension",
+
+    # Media Extensions
+    "com.apple.photo-editing": ".photoediting",
+    "com.apple.audiounit-ui": ".audiounit",
+    "com.apple.broadcast-services-upload": ".broadcastupload",
+    "com.apple.broadcast-services-setup": ".broadcastsetup",
+
+    # Keyboard & Input Extensions
+    "com.apple.keyboard-service": ".keyboard",
+
+    # iMessage Extensions
+    "com.apple.message-payload-provider": ".imessage",
+    "com.apple.messages.MSMessagesAppExtension": ".imessageapp",
+    "com.apple.messages-sticker-pack": ".stickers",
+
+    # Siri & Intents Extensions
+    "com.apple.intents-service": ".intents",
+    "com.apple.intents-ui-service": ".intentsui",
+
+    # File & Document Extensions
+    "com.apple.fileprovider-ui": ".fileproviderui",
+    "com.apple.fileprovider-nonui": ".fileprovider",
+    "com.apple.quicklook.preview": ".quicklook",
+    "com.apple.DocumentPicker": ".documentpicker",
+
+    # Security & Privacy Extensions
+    "com.apple.authentication-services-credential-provider-ui": ".credentialprovider",
+    "com.apple.callkit.call-directory": ".calldirectory",
+    "com.apple.identitylookup.message-filter": ".messagefilter",
+
+    # Content & Safari Extensions
+    "com.apple.Safari.content-blocker": ".contentblocker",
+    "com.apple.Safari.extension": ".safariextension",
+    "com.apple.Safari.web-extension": ".safariwebextension",
+
+    # Network Extensions
+    "com.apple.networkextension.packet-tunnel": ".vpn",
+    "com.apple.networkextension.app-proxy": ".appproxy",
+    "com.apple.networkextension.filter-data": ".filterdata",
+    "com.apple.networkextension.filter-control": ".filtercontrol",
+    "com.apple.networkextension.dns-proxy": ".dnsproxy",
+
+    # Spotlight & Search Extensions
+    "com.apple.spotlight.index": ".spotlightindex",
+    "com.apple.services": ".services",
+
+    # Location Extensions
+    "com.apple.location.push.service": ".locationpush",
+
+    # ClassKit Extensions
+    "com.apple.classkit.context-provider": ".classkit",
+
+    # Matter Extensions
+    "com.apple.matter.support.extension.device-setup": ".mattersetup",
+
+    # Background Assets
+    "com.apple.background-asset-downloader-extension": ".backgroundassets",
+}
+
+
 class ComponentData(NamedTuple):
     """Data for a component being signed."""
     old_bundle_id: str
@@ -71,8 +214,12 @@ class Signer:
         main_info_plist = get_info_plist_path(main_app)
         main_info: Dict[Any, Any] = plist_load(main_info_plist)
         self.old_main_bundle_id = main_info["CFBundleIdentifier"]
+        self._old_main_len = len(self.old_main_bundle_id)
         self.is_distribution = "Distribution" in opts.common_name
         self.is_mac_app = main_info_plist.parent.name == "Contents"
+        self._app_id_key = self._get_application_identifier_key()
+        self._aps_environment_key = self._get_aps_environment_key()
+        self._supported_entitlements = _SUPPORTED_ENTITLEMENTS_MAC if self.is_mac_app else _SUPPORTED_ENTITLEMENTS_IOS
         self.app_type = get_app_type(opts.app_dir)
         print(f"App type: {self.app_type}")
 
@@ -83,6 +230,9 @@ class Signer:
 
         self.mappings: Dict[str, str] = {}
         self.removed_entitlements = set()
+        self._remap_defs = [
+            RemapDef(e, p.format(team_id=opts.team_id), po, il) for e, p, po, il in _REMAP_TEMPLATES
+        ]
 
         # Determine main bundle ID based on configuration
         self._determine_main_bundle_id()
@@ -112,17 +262,16 @@ class Signer:
         with main_info_plist.open("wb") as f:
             plist_dump(main_info, f)
 
-        # Remove Watch components if present
-        for watch_name in ["com.apple.WatchPlaceholder", "Watch"]:
-            watch_dir = main_app.joinpath(watch_name)
-            if watch_dir.exists():
-                print(f"Removing {watch_name} directory")
-                shutil.rmtree(watch_dir)
-
-        # Identify all components to be signed (depth-first order)
-        component_exts = ["*.app", "*.appex", "*.framework", "*.dylib", "PlugIns/*.bundle"]
-        self.components = [item for e in component_exts for item in safe_glob(main_app, "**/" + e)][::-1]
+        # Identify all components to be signed (depth-first order), leaving out Watch components
+        walk = walk_components(main_app, prune=["com.apple.WatchPlaceholder", "Watch"])
+        self.components = walk.components
         self.components.append(main_app)
+        self._sc_info = walk.sc_info
+
+        # Remove Watch components if present
+        for watch_dir in walk.pruned:
+            print(f"Removing {watch_dir.name} directory")
+            shutil.rmtree(watch_dir)
 
     def _determine_main_bundle_id(self):
         """Determine the main bundle ID based on configuration."""
@@ -134,7 +283,7 @@ class Signer:
                 self.main_bundle_id = self.old_main_bundle_id
             elif self.opts.bundle_id == "":
                 print("Using provisioning profile's application id")
-                prov_app_id = dump_prov_entitlements(self.opts.prov_file)[self._get_application_identifier_key()]
+                prov_app_id = dump_prov_entitlements(self.opts.prov_file)[self._app_id_key]
                 self.main_bundle_id = prov_app_id[prov_app_id.find(".") + 1 :]
                 if self.main_bundle_id == "*":
                     print("Provisioning profile is wildcard, using original bundle id")
@@ -182,10 +331,38 @@ class Signer:
         """Get the correct APS environment key for the platform."""
         return "com.apple.developer.aps-environment" if self.is_mac_app else "aps-environment"
 
-    def _sign_secondary(self, component: Path, tmpdir: Path):
-        """Sign secondary components (frameworks, etc.) with original entitlements."""
-        print("Signing with original entitlements")
-        return codesign_async(self.opts.common_name, component)
+    def _get_embedded_prov_path(self, data: ComponentData) -> Path:
+        """Get the path of the embedded provisioning profile for a primary component."""
+        return data.info_plist.parent.joinpath(
+            "embedded.provisionprofile" if self.is_mac_app else "embedded.mobileprovision"
+        )
+
+    def _register_components(self, primaries: List[ComponentData]):
+        """Register all primary components with Apple and generate their provisioning profiles."""
+        print("Registering components with Apple...")
+        fastlane_register_apps(
+            self.opts.account_name,
+            self.opts.account_pass,
+            self.opts.team_id,
+            [(data.bundle_id, data.entitlements) for data in primaries],
+        )
+
+        print("Generating provisioning profiles...")
+        prov_type = "adhoc" if self.is_distribution else "development"
+        platform = "macos" if self.is_mac_app else "ios"
+        fastlane_get_prov_profiles(
+            self.opts.account_name,
+            self.opts.account_pass,
+            self.opts.team_id,
+            [(data.bundle_id, self._get_embedded_prov_path(data)) for data in primaries],
+            prov_type,
+            platform,
+        )
+
+    def _sign_secondary(self, components: List[Path], tmpdir: Path):
+        """Sign secondary components (frameworks, etc.) with original entitlements in one codesign call."""
+        print(f"Signing {len(components)} component(s) with original entitlements")
+        return codesign_batch_async(self.opts.common_name, components)
 
     def _sign_primary(self, component: Path, tmpdir: Path, data: ComponentData):
         """Sign primary components (apps, extensions) with custom entitlements."""
@@ -237,57 +414,36 @@ class Signer:
         print("Signing with entitlements:")
         print_object(data.entitlements)
 
-        # Handle provisioning profile
-        embedded_prov = data.info_plist.parent.joinpath(
-            "embedded.provisionprofile" if self.is_mac_app else "embedded.mobileprovision"
-        )
+        # Handle provisioning profile; generated profiles are already in place (see _register_components)
         if self.opts.prov_file is not None:
-            shutil.copy2(self.opts.prov_file, embedded_prov)
-        else:
-            print("Registering component with Apple...")
-            fastlane_register_app(
-                self.opts.account_name, self.opts.account_pass, self.opts.team_id, data.bundle_id, data.entitlements
-            )
+            link_or_copy(self.opts.prov_file, self._get_embedded_prov_path(data))
 
-            print("Generating provisioning profile...")
-            prov_type = "adhoc" if self.is_distribution else "development"
-            platform = "macos" if self.is_mac_app else "ios"
-            fastlane_get_prov_profile(
-                self.opts.account_name,
-                self.opts.account_pass,
-                self.opts.team_id,
-                data.bundle_id,
-                prov_type,
-                platform,
-                embedded_prov,
-            )
-
-        # Create entitlements file and sign
-        entitlements_plist = Path(tmpdir).joinpath("entitlements.plist")
+        # Create entitlements file and sign; each component gets its own file
+        # since several may be signing at the same time
+        entitlements_plist = Path(tempfile.mkdtemp(dir=tmpdir)).joinpath("entitlements.plist")
         with open(entitlements_plist, "wb") as f:
-            plist_dump(data.entitlements, f)
+            # codesign embeds the entitlements as given and the system expects XML
+            plist_dump(data.entitlements, f, fmt=plistlib.FMT_XML)
 
         print("Signing component...")
         return codesign_async(self.opts.common_name, component, entitlements_plist)
 
-    def _get_extension_bundle_suffix(self, component: Path) -> Optional[str]:
+    def _get_extension_bundle_suffix(self, component: Path, info: Dict[Any, Any]) -> Optional[str]:
         """
         Detect extension type and return appropriate bundle ID suffix.
 
-        This method reads the extension's Info.plist and checks the NSExtensionPointIdentifier
+        This method checks the NSExtensionPointIdentifier in the extension's Info.plist
         to determine what type of extension it is, then returns the appropriate suffix.
 
         Args:
             component: Path to the component (.appex file)
+            info: The component's already loaded Info.plist
 
         Returns:
             Custom suffix string (like '.widgetkit') for known extension types,
             or None if not an extension or unknown type
         """
         try:
-            info_plist = get_info_plist_path(component)
-            info: Dict[Any, Any] = plist_load(info_plist)
-
             # Check if this component has extension information
             ns_extension = info.get("NSExtension", {})
             if not ns_extension:
@@ -295,82 +451,7 @@ class Signer:
 
             extension_point = ns_extension.get("NSExtensionPointIdentifier", "")
 
-            # Map extension point identifiers to bundle ID suffixes
-            # Comprehensive list of iOS/iPadOS/watchOS extension types
-            extension_map = {
-                # Widget Extensions
-                "com.apple.widgetkit-extension": ".widgetkit",
-                "com.apple.widget-extension": ".widgetkit",  # Legacy widget
-                "com.apple.today-widget": ".todaywidget",
-                "com.apple.glance-widget": ".glancewidget",  # watchOS
-
-                # Notification Extensions
-                "com.apple.usernotifications.service": ".notificationservice",
-                "com.apple.usernotifications.content-extension": ".notificationcontent",
-
-                # Share & Action Extensions
-                "com.apple.share-services": ".shareextension",
-                "com.apple.ui-services": ".actionextension",
-
-                # Media Extensions
-                "com.apple.photo-editing": ".photoediting",
-                "com.apple.audiounit-ui": ".audiounit",
-                "com.apple.broadcast-services-upload": ".broadcastupload",
-                "com.apple.broadcast-services-setup": ".broadcastsetup",
-
-                # Keyboard & Input Extensions
-                "com.apple.keyboard-service": ".keyboard",
-
-                # iMessage Extensions
-                "com.apple.message-payload-provider": ".imessage",
-                "com.apple.messages.MSMessagesAppExtension": ".imessageapp",
-                "com.apple.messages-sticker-pack": ".stickers",
-
-                # Siri & Intents Extensions
-                "com.apple.intents-service": ".intents",
-                "com.apple.intents-ui-service": ".intentsui",
-
-                # File & Document Extensions
-                "com.apple.fileprovider-ui": ".fileproviderui",
-                "com.apple.fileprovider-nonui": ".fileprovider",
-                "com.apple.quicklook.preview": ".quicklook",
-                "com.apple.DocumentPicker": ".documentpicker",
-
-                # Security & Privacy Extensions
-                "com.apple.authentication-services-credential-provider-ui": ".credentialprovider",
-                "com.apple.callkit.call-directory": ".calldirectory",
-                "com.apple.identitylookup.message-filter": ".messagefilter",
-
-                # Content & Safari Extensions
-                "com.apple.Safari.content-blocker": ".contentblocker",
-                "com.apple.Safari.extension": ".safariextension",
-                "com.apple.Safari.web-extension": ".safariwebextension",
-
-                # Network Extensions
-                "com.apple.networkextension.packet-tunnel": ".vpn",
-                "com.apple.networkextension.app-proxy": ".appproxy",
-                "com.apple.networkextension.filter-data": ".filterdata",
-                "com.apple.networkextension.filter-control": ".filtercontrol",
-                "com.apple.networkextension.dns-proxy": ".dnsproxy",
-
-                # Spotlight & Search Extensions
-                "com.apple.spotlight.index": ".spotlightindex",
-                "com.apple.services": ".services",
-
-                # Location Extensions
-                "com.apple.location.push.service": ".locationpush",
-
-                # ClassKit Extensions
-                "com.apple.classkit.context-provider": ".classkit",
-
-                # Matter Extensions
-                "com.apple.matter.support.extension.device-setup": ".mattersetup",
-
-                # Background Assets
-                "com.apple.background-asset-downloader-extension": ".backgroundassets",
-            }
-
-            return extension_map.get(extension_point)
+            return _EXTENSION_BUNDLE_SUFFIXES.get(extension_point)
 
         except Exception as e:
             print(f"Could not detect extension type for {component.name}: {e}")
@@ -379,11 +460,11 @@ class Signer:
     def _prepare_primary(self, component: Path, workdir: Path):
         """Prepare primary component for signing by processing entitlements."""
         info_plist = get_info_plist_path(component)
-        info: Dict[Any, Any] = plist_load(info_plist)
+        info: Dict[Any, Any] = plist_load(info_plist, readonly=True)
         old_bundle_id = info["CFBundleIdentifier"]
 
         # Check if this is an extension with a custom bundle ID pattern
-        custom_suffix = self._get_extension_bundle_suffix(component)
+        custom_suffix = self._get_extension_bundle_suffix(component, info)
 
         if custom_suffix:
             # Use the custom extension pattern (e.g., .widgetkit for widgets)
@@ -393,7 +474,7 @@ class Signer:
             print(f"  New bundle ID: {bundle_id}")
         else:
             # Create bundle id by suffixing the existing main bundle id with the original suffix
-            bundle_id = f"{self.main_bundle_id}{old_bundle_id[len(self.old_main_bundle_id):]}"
+            bundle_id = self.main_bundle_id + old_bundle_id[self._old_main_len:]
         if not self.opts.force_original_id and old_bundle_id != bundle_id:
             if len(old_bundle_id) != len(bundle_id):
                 print(
@@ -404,9 +485,13 @@ class Signer:
                 self.mappings[old_bundle_id] = bundle_id
 
         # Extract existing entitlements
+        if info_plist.parent.name == "Contents":
+            executable = info_plist.parent.joinpath("MacOS", info.get("CFBundleExecutable", ""))
+        else:
+            executable = component.joinpath(info.get("CFBundleExecutable", ""))
         old_entitlements: Dict[Any, Any]
         try:
-            old_entitlements = codesign_dump_entitlements(component)
+            old_entitlements = codesign_dump_entitlements(component, executable)
         except:
             print("Failed to dump entitlements, using empty")
             old_entitlements = {}
@@ -437,7 +522,7 @@ class Signer:
                 self.mappings[old_team_id] = self.opts.team_id
 
         # Process app ID prefix
-        old_app_id_prefix: Optional[str] = old_entitlements.get(self._get_application_identifier_key(), "").split(".")[0]
+        old_app_id_prefix: Optional[str] = old_entitlements.get(self._app_id_key, "").split(".")[0]
         if not old_app_id_prefix:
             old_app_id_prefix = None
             print("Failed to read old app id prefix")
@@ -451,13 +536,13 @@ class Signer:
         """Process entitlements when using a provisioning profile."""
         entitlements = dump_prov_entitlements(self.opts.prov_file)
 
-        prov_app_id = entitlements[self._get_application_identifier_key()]
+        prov_app_id = entitlements[self._app_id_key]
         component_app_id = f"{self.opts.team_id}.{bundle_id}"
         wildcard_app_id = f"{self.opts.team_id}.*"
 
         # Handle wildcard app ID
         if prov_app_id == wildcard_app_id:
-            entitlements[self._get_application_identifier_key()] = component_app_id
+            entitlements[self._app_id_key] = component_app_id
         elif prov_app_id != component_app_id:
             print(
                 f"WARNING: Provisioning profile's app id '{prov_app_id}' does not match component's app id '{component_app_id}'.",
@@ -479,59 +564,21 @@ class Signer:
 
     def _process_generated_entitlements(self, old_entitlements: Dict[Any, Any], bundle_id: str) -> Dict[Any, Any]:
         """Process entitlements when generating new ones."""
-        supported_entitlements = [
-            self._get_application_identifier_key(),
-            "com.apple.developer.team-identifier",
-            "com.apple.developer.healthkit",
-            "com.apple.developer.healthkit.access",
-            "com.apple.developer.homekit",
-            "com.apple.external-accessory.wireless-configuration",
-            "com.apple.security.application-groups",
-            "inter-app-audio",
-            "get-task-allow",
-            "keychain-access-groups",
-            self._get_aps_environment_key(),
-            "com.apple.developer.icloud-container-development-container-identifiers",
-            "com.apple.developer.icloud-container-environment",
-            "com.apple.developer.icloud-container-identifiers",
-            "com.apple.developer.icloud-services",
-            "com.apple.developer.kernel.extended-virtual-addressing",
-            "com.apple.developer.networking.multipath",
-            "com.apple.developer.networking.networkextension",
-            "com.apple.developer.networking.vpn.api",
-            "com.apple.developer.networking.wifi-info",
-            "com.apple.developer.nfc.readersession.formats",
-            "com.apple.developer.siri",
-            "com.apple.developer.ubiquity-container-identifiers",
-            "com.apple.developer.ubiquity-kvstore-identifier",
-            "com.apple.developer.associated-domains",
-            # macOS only
-            "com.apple.security.app-sandbox",
-            "com.apple.security.assets.pictures.read-write",
-            "com.apple.security.cs.allow-jit",
-            "com.apple.security.cs.allow-unsigned-executable-memory",
-            "com.apple.security.cs.disable-library-validation",
-            "com.apple.security.device.audio-input",
-            "com.apple.security.device.bluetooth",
-            "com.apple.security.device.usb",
-            "com.apple.security.files.user-selected.read-only",
-            "com.apple.security.files.user-selected.read-write",
-            "com.apple.security.network.client",
-            "com.apple.security.network.server",
-        ]
-
-        entitlements = copy.deepcopy(old_entitlements)
-        for entitlement in list(entitlements):
-            if entitlement not in supported_entitlements:
-                self.removed_entitlements.add(entitlement)
-                entitlements.pop(entitlement)
+        # Only top-level keys are replaced later on, so copying list and dict values
+        # one level deep is enough to leave the original entitlements untouched
+        entitlements = {
+            k: list(v) if isinstance(v, list) else dict(v) if isinstance(v, dict) else v
+            for k, v in old_entitlements.items()
+            if k in self._supported_entitlements
+        }
+        self.removed_entitlements.update(old_entitlements.keys() - self._supported_entitlements)
 
         # Set environment-sensitive entitlements
         for entitlement, value in {
             "com.apple.developer.icloud-container-environment": (
                 "Production" if self.is_distribution else "Development"
             ),
-            self._get_aps_environment_key(): "production" if self.is_distribution else "development",
+            self._aps_environment_key: "production" if self.is_distribution else "development",
             "get-task-allow": False if self.is_distribution else True,
         }.items():
             if entitlement in entitlements:
@@ -539,7 +586,7 @@ class Signer:
 
         # Set required identifiers
         entitlements["com.apple.developer.team-identifier"] = self.opts.team_id
-        entitlements[self._get_application_identifier_key()] = f"{self.opts.team_id}.{bundle_id}"
+        entitlements[self._app_id_key] = f"{self.opts.team_id}.{bundle_id}"
 
         # Remap IDs if encoding is enabled
         if self.opts.encode_ids:
@@ -549,23 +596,7 @@ class Signer:
 
     def _remap_entitlement_ids(self, entitlements: Dict[Any, Any]):
         """Remap entitlement IDs when encoding is enabled."""
-        for remap_def in (
-            RemapDef(["com.apple.security.application-groups"], "group.", False, True),
-            RemapDef(
-                [
-                    "com.apple.developer.icloud-container-identifiers",
-                    "com.apple.developer.ubiquity-container-identifiers",
-                    "com.apple.developer.icloud-container-development-container-identifiers",
-                ],
-                "iCloud.",
-                False,
-                True,
-            ),
-            RemapDef(["keychain-access-groups"], self.opts.team_id + ".", True, True),
-            RemapDef(
-                ["com.apple.developer.ubiquity-kvstore-identifier"], self.opts.team_id + ".", False, False
-            ),
-        ):
+        for remap_def in self._remap_defs:
             for entitlement in remap_def.entitlements:
                 remap_ids = entitlements.get(entitlement, [])
                 if isinstance(remap_ids, str):
@@ -652,62 +683,91 @@ class Signer:
             )
             report_progress(44, "Device registered successfully")
 
-            # Sign all components
-            jobs: Dict[Path, subprocess.Popen] = {}
-            total_components = len(job_defs)
-            current_component = 0
-
+            # Register every primary component and generate its profile before
+            # signing, so the fastlane runs can overlap
+            primaries = [data for _, data in job_defs if data is not None]
+            if self.opts.prov_file is None and primaries:
+                self._register_components(primaries)
+
+            # Secondary components share their signing arguments, and those at the
+            # same depth cannot contain each other, so each depth is signed with a
+            # single codesign call; primary components keep their own entitlements
+            batches: List[Tuple[List[Path], Optional[ComponentData]]] = []
+            secondary_by_depth: Dict[int, List[Path]] = {}
             for component, data in job_defs:
-                current_component += 1
-                progress = 45 + (current_component * 27 // total_components)  # 45-72% for signing components
-                component_name = component.name if hasattr(component, 'name') else str(component).split('/')[-1]
-                print(f"Processing component {component}")
-                report_progress(progress, f"Signing: {component_name} ({current_component}/{total_components})")
-
-                # Wait for sub-components to finish
-                for path in list(jobs.keys()):
-                    pipe = jobs[path]
-                    try:
-                        path.relative_to(component)
-                    except:
-                        continue
-                    if pipe.poll() is None:
-                        print("Waiting for sub-component to finish signing:", path)
-                        pipe.wait()
-                    popen_check(pipe)
-                    jobs.pop(path)
-
-                # Remove AppStore metadata
-                sc_info = component.joinpath("SC_Info")
-                if sc_info.exists():
-                    print(
-                        f"WARNING: Found leftover AppStore metadata - removing it.",
-                        "If the app is encrypted, it will fail to launch!",
-                        sep="\n",
-                    )
-                    shutil.rmtree(sc_info)
-
-                # Apply binary patches
-                if self.opts.patch_ids:
-                    self._apply_binary_patches(component, data)
-
-                # Start signing process
-                if data is not None:
-                    jobs[component] = self._sign_primary(component, tmpdir, data)
+                if data is None:
+                    secondary_by_depth.setdefault(len(component.parts), []).append(component)
                 else:
-                    jobs[component] = self._sign_secondary(component, tmpdir)
+                    batches.append(([component], data))
+            batches.extend((components, None) for components in secondary_by_depth.values())
 
-            # Wait for all signing jobs to complete
-            print("Waiting for any remaining components to finish signing")
-            for pipe in jobs.values():
-                pipe.wait()
+            # Sign all batches, each one only after everything nested inside it
+            # is signed; deepest batches are submitted first so a worker never
+            # waits on a batch that has not been started yet
+            total_components = len(job_defs)
+            progress_lock = threading.Lock()
+            started = [0]
+
+            def sign_batch(components: List[Path], data: Optional[ComponentData], children: List[Future]):
+                # Wait for sub-components to finish, failing if any of them did
+                for child in children:
+                    child.result()
+
+                for component in components:
+                    with progress_lock:
+                        started[0] += 1
+                        progress = 45 + (started[0] * 27 // total_components)  # 45-72% for signing components
+                        print(f"Processing component {component}")
+                        report_progress(progress, f"Signing: {component.name} ({started[0]}/{total_components})")
+
+                    # Remove AppStore metadata
+                    sc_info = component.joinpath("SC_Info")
+                    if sc_info in self._sc_info:
+                        print(
+                            f"WARNING: Found leftover AppStore metadata - removing it.",
+                            "If the app is encrypted, it will fail to launch!",
+                            sep="\n",
+                        )
+                        shutil.rmtree(sc_info)
+
+                    # Apply binary patches
+                    if self.opts.patch_ids:
+                        self._apply_binary_patches(component, data)
+
+                # Sign and wait for codesign to finish
+                if data is not None:
+                    pipe = self._sign_primary(components[0], tmpdir, data)
+                else:
+                    pipe = self._sign_secondary(components, tmpdir)
                 popen_check(pipe)
 
+            # Map each component to the components directly nested inside it; waiting on
+            # those is enough since they in turn wait on everything nested inside them
+            component_set = set(self.components)
+            children_of: Dict[Path, List[Path]] = {}
+            for component in self.components:
+                parent = next((p for p in component.parents if p in component_set), None)
+                if parent is not None:
+                    children_of.setdefault(parent, []).append(component)
+
+            jobs: Dict[Path, Future] = {}
+            with ThreadPoolExecutor(max_workers=SIGN_MAX_WORKERS) as executor:
+                for components, data in sorted(batches, key=lambda b: len(b[0][0].parts), reverse=True):
+                    children = list(dict.fromkeys(
+                        jobs[child] for c in components for child in children_of.get(c, [])
+                    ))
+                    job = executor.submit(sign_batch, components, data, children)
+                    jobs.update(dict.fromkeys(components, job))
+
+                print("Waiting for all components to finish signing")
+                for job in dict.fromkeys(jobs.values()):
+                    job.result()
+
     def _apply_binary_patches(self, component: Path, data: Optional[ComponentData]):
         """Apply binary patches to replace old identifiers with new ones."""
-        # Only patch mappings with same length to avoid breaking binary structure
-        patches = {k: v for k, v in self.mappings.items() if len(k) == len(v)}
-        patches = dict(sorted(self.mappings.items(), key=lambda x: len(x[0]), reverse=True))
+        # Only patch mappings with same length to avoid breaking binary structure,
+        # and skip mappings that would not change anything
+        patches = {k: v for k, v in self.mappings.items() if len(k) == len(v) and k != v}
 
         if len(patches) < 1:
             print("Nothing to patch")
@@ -719,5 +779,4 @@ class Signer:
                 targets.append(data.info_plist)
             for target in targets:
                 print(f"Patching {len(patches)} patterns in {target}")
-                for old, new in patches.items():
-                    binary_replace(f"s/{re.escape(old)}/{re.escape(new)}/g", target)
+                binary_replace_all(target, patches)
@@ -12,74 +12,68 @@ import tempfile
 from pathlib import Path
 from typing import Dict
 from .utils import (
-    safe_glob, extract_zip, extract_tar, move_merge_replace,
-    get_binary_map, get_otool_imports, install_name_change,
+    safe_glob, find_symlinks, extract_zip, extract_tar, extract_deb_data, move_merge_replace,
+    get_binary_map, is_macho, get_otool_imports_bulk, install_name_changes, map_binaries,
     insert_dylib, plist_load, get_info_plist_path, get_main_app_path
 )
 
 def extract_deb(app_bin_name: str, app_bundle_id: str, archive: Path, dest_dir: Path):
     """Extract .deb package and filter relevant files for the target app."""
-    from .utils import run_process, extract_tar
-
-    with tempfile.TemporaryDirectory() as temp_dir_str:
-        temp_dir = Path(temp_dir_str)
-        run_process("ar", "x", str(archive.resolve()), cwd=str(temp_dir))
-        with tempfile.TemporaryDirectory() as temp_dir2_str:
-            temp_dir2 = Path(temp_dir2_str)
-            extract_tar(next(safe_glob(temp_dir, "data.tar*")), temp_dir2)
-
-            for file in safe_glob(temp_dir2, "**/*"):
-                if file.is_symlink():
-                    target = file.resolve()
-                    if target.is_absolute():
-                        target = temp_dir2.joinpath(str(target)[1:])
-                        os.unlink(file)
-                        if target.is_dir():
-                            shutil.copytree(target, file)
-                        else:
-                            shutil.copy2(target, file)
-
-            rootless_dir = temp_dir2 / "var" / "jb"
-            if rootless_dir.is_dir():
-                temp_dir2 = rootless_dir
-
-            for glob in [
-                "Library/Application Support/*/*.bundle",
-                "Library/Application Support/*",  # *.bundle, background@2x.png
-                "Library/Frameworks/*.framework",
-                "usr/lib/*.framework",
-            ]:
-                for file in safe_glob(temp_dir2, glob):
-                    # skip empty directories
-                    if file.is_dir() and next(safe_glob(file, "*"), None) is None:
-                        continue
-                    move_merge_replace(file, dest_dir)
-            for glob in [
-                "Library/MobileSubstrate/DynamicLibraries/*.dylib",
-                "usr/lib/*.dylib",
-            ]:
-                for file in safe_glob(temp_dir2, glob):
-                    if not file.is_file():
-                        continue
-                    file_plist = file.parent.joinpath(file.stem + ".plist")
-                    if file_plist.exists():
-                        info = plist_load(file_plist)
-                        if "Filter" in info:
-                            ok = False
-                            if "Bundles" in info["Filter"] and app_bundle_id in info["Filter"]["Bundles"]:
-                                ok = True
-                            elif "Executables" in info["Filter"] and app_bin_name in info["Filter"]["Executables"]:
-                                ok = True
-                            if not ok:
-                                continue
-                    move_merge_replace(file, dest_dir)
+    with tempfile.TemporaryDirectory() as temp_dir2_str:
+        temp_dir2 = Path(temp_dir2_str)
+        extract_deb_data(archive, temp_dir2)
+
+        for file in find_symlinks(temp_dir2):
+            target = file.resolve()
+            if target.is_absolute():
+                target = temp_dir2.joinpath(str(target)[1:])
+                os.unlink(file)
+                if target.is_dir():
+                    shutil.copytree(target, file)
+                else:
+                    shutil.copy2(target, file)
+
+        rootless_dir = temp_dir2 / "var" / "jb"
+        if rootless_dir.is_dir():
+            temp_dir2 = rootless_dir
+
+        for glob in [
+            "Library/Application Support/*/*.bundle",
+            "Library/Application Support/*",  # *.bundle, background@2x.png
+            "Library/Frameworks/*.framework",
+            "usr/lib/*.framework",
+        ]:
+            for file in safe_glob(temp_dir2, glob, sort=True):
+                # skip empty directories
+                if file.is_dir() and next(safe_glob(file, "*"), None) is None:
+                    continue
+                move_merge_replace(file, dest_dir)
+        for glob in [
+            "Library/MobileSubstrate/DynamicLibraries/*.dylib",
+            "usr/lib/*.dylib",
+        ]:
+            for file in safe_glob(temp_dir2, glob, sort=True):
+                if not file.is_file():
+                    continue
+                file_plist = file.parent.joinpath(file.stem + ".plist")
+                if file_plist.exists():
+                    info = plist_load(file_plist, readonly=True)
+                    if "Filter" in info:
+                        ok = False
+                        if "Bundles" in info["Filter"] and app_bundle_id in info["Filter"]["Bundles"]:
+                            ok = True
+                        elif "Executables" in info["Filter"] and app_bin_name in info["Filter"]["Executables"]:
+                            ok = True
+                        if not ok:
+                            continue
+                move_merge_replace(file, dest_dir)
 
 
 def inject_tweaks(ipa_dir: Path, tweaks_dir: Path):
     """Inject tweaks, frameworks, and dynamic libraries into the app."""
     main_app = get_main_app_path(ipa_dir)
     main_info_plist = get_info_plist_path(main_app)
-    info = plist_load(main_info_plist)
+    info = plist_load(main_info_plist, readonly=True)
     app_bundle_id = info["CFBundleIdentifier"]
     app_bundle_exe = info["CFBundleExecutable"]
     is_mac_app = main_info_plist.parent.name == "Contents"
@@ -95,7 +89,7 @@ def inject_tweaks(ipa_dir: Path, tweaks_dir: Path):
 
     with tempfile.TemporaryDirectory() as temp_dir_str:
         temp_dir = Path(temp_dir_str)
-        for tweak in safe_glob(tweaks_dir, "*"):
+        for tweak in safe_glob(tweaks_dir, "*", sort=True):
             print("Processing", tweak.name)
             if tweak.suffix == ".zip":
                 extract_zip(tweak, temp_dir)
@@ -107,11 +101,10 @@ def inject_tweaks(ipa_dir: Path, tweaks_dir: Path):
                 move_merge_replace(tweak, temp_dir)
 
         # move files if we know where they need to go
-        move_map = {"Frameworks": ["*.framework", "*.dylib"], "PlugIns": ["*.appex"]}
-        for dest_dir, globs in move_map.items():
-            for glob in globs:
-                for file in safe_glob(temp_dir, glob):
-                    move_merge_replace(file, temp_dir.joinpath(dest_dir))
+        move_map = {".framework": "Frameworks", ".dylib": "Frameworks", ".appex": "PlugIns"}
+        for file in safe_glob(temp_dir, "*", sort=True):
+            if file.suffix in move_map:
+                move_merge_replace(file, temp_dir.joinpath(move_map[file.suffix]))
 
         # NOTE: https://iphonedev.wiki/index.php/Cydia_Substrate
         # hooking with "MSHookFunction" does not work in a jailed environment using any of the libs
@@ -142,8 +135,10 @@ def inject_tweaks(ipa_dir: Path, tweaks_dir: Path):
                 insert_dylib(app_bin, binary_fixed, False)
 
         # detect any references to support libs and install missing files
-        for binary_path in binary_map.values():
-            for link in get_otool_imports(binary_path):
+        installed_map = {}
+        imports_map = get_otool_imports_bulk(list(binary_map.values()))
+        for binary_path, imports in imports_map.items():
+            for link in imports:
                 link_path = Path(link)
                 for lib_dir, lib_names in support_libs.items():
                     if link_path.name not in lib_names:
@@ -155,19 +150,28 @@ def inject_tweaks(ipa_dir: Path, tweaks_dir: Path):
                             print(f"Installing {lib_src.name} to {lib_dest}")
                             lib_dest.parent.mkdir(exist_ok=True, parents=True)
                             shutil.copy2(lib_src, lib_dest)
+                            if is_macho(lib_dest):
+                                installed_map[lib_dest.name] = lib_dest
 
-        # refresh the binary map with any new libs from previous step
-        binary_map = get_binary_map(temp_dir)
+        # add any new libs from previous step to the binary map
+        binary_map.update(installed_map)
+        imports_map.update(get_otool_imports_bulk(list(installed_map.values())))
 
         # re-link any dependencies
-        for binary_path in binary_map.values():
-            for link in get_otool_imports(binary_path):
+        relinks = {}
+        for binary_path, imports in imports_map.items():
+            changes = []
+            for link in imports:
                 link_path = Path(link)
                 link_name = aliases[link_path.name] if link_path.name in aliases else link_path.name
                 if link_name in binary_map:
                     link_fixed = base_load_path.joinpath(binary_map[link_name].relative_to(temp_dir))
                     print("Re-linking", binary_path, link_path, link_fixed)
-                    install_name_change(binary_path, link_path, link_fixed, False)
+                    changes.append((link_path, link_fixed))
+            if changes:
+                relinks[binary_path] = changes
+        # each binary is rewritten by its own install_name_tool run, so they can all run at once
+        map_binaries(lambda relink: install_name_changes(*relink, capture=False), relinks.items())
 
         for file in safe_glob(temp_dir, "*"):
             move_merge_replace(file, base_dir)
@@ -8,6 +8,12 @@ including file operations, process execution, and data conversion utilities.
 
 import os
 import re
+import copy
+import base64
+import fnmatch
+import asyncio
+import contextlib
+import mmap
 import sys
 import subprocess
 import tempfile
@@ -15,18 +21,133 @@ import json
 import random
 import string
 import shutil
+import stat
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Mapping, Union
+from typing import Callable, Collection, Dict, Iterable, Iterator, List, Any, NamedTuple, Optional, Mapping, Set, Tuple, Union
 import plistlib
 
 StrPath = Union[str, Path]
 
-def safe_glob(input: Path, pattern: str):
-    """Safely iterate through files matching a pattern, excluding system files."""
-    for f in sorted(input.glob(pattern)):
-        if not f.name.startswith("._") and f.name not in [".DS_Store", ".AppleDouble", "__MACOSX"]:
+# Finder and archive metadata that is never part of an app
+IGNORED_NAMES = frozenset([".DS_Store", ".AppleDouble", "__MACOSX"])
+
+# Bundles and binaries that have to be signed individually
+COMPONENT_SUFFIXES = (".app", ".appex", ".framework", ".dylib")
+
+# Threads used to probe files for Mach-O magic bytes
+BINARY_PROBE_WORKERS = 16
+
+# Deflate level for the signed IPA: most of an app is already-compressed assets, so higher
+# levels cost several times the CPU for an archive that is only a few percent smaller
+ZIP_COMPRESS_LEVEL = 1
+
+# Characters used by rand_str
+_RAND_ALPHABET = string.ascii_lowercase + string.digits
+
+# Mach-O magic numbers: 32/64-bit in either byte order, and fat (universal) binaries
+MACHO_MAGICS = frozenset([
+    b"\xce\xfa\xed\xfe", b"\xcf\xfa\xed\xfe",
+    b"\xfe\xed\xfa\xce", b"\xfe\xed\xfa\xcf",
+    b"\xca\xfe\xba\xbe", b"\xbe\xba\xfe\xca",
+])
+
+def find_symlinks(root: Path) -> List[Path]:
+    """List the symlinks below a directory, excluding system files, without following any of them."""
+    links = []
+    dirs = [str(root)]
+    while dirs:
+        with os.scandir(dirs.pop()) as it:
+            for entry in it:
+                # the entry type comes from the directory listing, no stat call needed
+                if entry.is_symlink():
+                    if not entry.name.startswith("._") and entry.name not in IGNORED_NAMES:
+                        links.append(Path(entry.path))
+                elif entry.is_dir():
+                    dirs.append(entry.path)
+    return sorted(links)
+
+
+def walk_files(root: Path) -> Iterator[Path]:
+    """Iterate through all files below a directory, excluding system files, without pathlib's glob overhead."""
+    for dir, _, files in os.walk(root):
+        for name in files:
+            if not name.startswith("._") and name not in IGNORED_NAMES:
+                yield Path(dir, name)
+
+
+def _scandir_glob(input: Path, name_pattern: str) -> Iterator[Path]:
+    """Equivalent of input.glob("**/" + name_pattern) built on os.scandir, which avoids a stat per entry."""
+    dirs = [str(input)]
+    while dirs:
+        with os.scandir(dirs.pop()) as it:
+            for entry in it:
+                if fnmatch.fnmatchcase(entry.name, name_pattern):
+                    yield Path(entry.path)
+                # like pathlib, don't descend into symlinked directories
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+
+
+def safe_glob(input: Path, pattern: str, *, sort: bool = False):
+    """Safely iterate through files matching a pattern, excluding system files; sort when order matters."""
+    name_pattern = pattern[3:] if pattern.startswith("**/") else None
+    if name_pattern and "/" not in name_pattern and "**" not in name_pattern:
+        matches = _scandir_glob(input, name_pattern)
+    else:
+        matches = input.glob(pattern)
+    for f in sorted(matches) if sort else matches:
+        if not f.name.startswith("._") and f.name not in IGNORED_NAMES:
             yield f
 
+
+class ComponentWalk(NamedTuple):
+    """Result of walking an app bundle for signable components."""
+    components: List[Path]
+    pruned: List[Path]
+    sc_info: Set[Path]
+
+
+def walk_components(root: Path, prune: Collection[str] = ()) -> ComponentWalk:
+    """
+    Find all signable components below root with a single directory walk.
+
+    Matches apps, extensions, frameworks, dylibs and bundles directly inside a PlugIns
+    directory, at any depth. Symlinked directories are not descended into.
+    Components are returned deepest first (the order they need to be signed in).
+
+    Entries directly inside root whose names are in prune are reported instead of walked,
+    and the AppStore metadata (SC_Info) found along the way is collected, so callers
+    don't need to probe for either.
+    """
+    components: List[Path] = []
+    pruned: List[Path] = []
+    sc_info: Set[Path] = set()
+    root_str = str(root)
+    pending = [root_str]
+    while pending:
+        directory = pending.pop()
+        in_plugins = os.path.basename(directory) == "PlugIns"
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if directory == root_str and name in prune:
+                    pruned.append(Path(entry.path))
+                    continue
+                if name == "SC_Info":
+                    sc_info.add(Path(entry.path))
+                if (name.endswith(COMPONENT_SUFFIXES) or (in_plugins and name.endswith(".bundle"))) and not (
+                    name.startswith("._") or name in IGNORED_NAMES
+                ):
+                    components.append(Path(entry.path))
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+    components.sort(key=lambda p: (-len(p.parts), p))
+    return ComponentWalk(components, pruned, sc_info)
+
 def decode_clean(b: bytes):
     """Decode bytes to clean UTF-8 string."""
     return "" if not b else b.decode("utf-8").strip()
@@ -39,10 +160,19 @@ def run_process(
     env: Optional[Mapping[str, str]] = None,
     cwd: Optional[str] = None,
     timeout: Optional[float] = None,
+    close_fds: bool = True,
 ):
-    """Run a subprocess with error handling."""
+    """
+    Run a subprocess with error handling.
+
+    Pass close_fds=False for commands that need no fd isolation (e.g. fastlane):
+    Python's own fds are non-inheritable anyway, and it lets subprocess use the
+    cheaper posix_spawn instead of fork + closing every inherited descriptor.
+    """
     try:
-        result = subprocess.run(cmd, capture_output=capture, check=check, env=env, cwd=cwd, timeout=timeout)
+        result = subprocess.run(
+            cmd, capture_output=capture, check=check, env=env, cwd=cwd, timeout=timeout, close_fds=close_fds
+        )
     except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
         raise (
             Exception(
@@ -63,16 +193,43 @@ def run_process_async(
     return subprocess.Popen(cmd, env=env, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
 
+async def run_process_aio(
+    *cmd: str,
+    env: Optional[Mapping[str, str]] = None,
+    cwd: Optional[str] = None,
+    limit: Optional[asyncio.Semaphore] = None,
+    close_fds: bool = True,
+):
+    """Run a subprocess from an asyncio event loop, optionally bounded by a semaphore."""
+    async with limit or contextlib.nullcontext():
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            env=env,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            close_fds=close_fds,
+        )
+        stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise Exception(
+            {
+                "message": f"{cmd} failed with status code {proc.returncode}",
+                "stdout": decode_clean(stdout),
+                "stderr": decode_clean(stderr),
+            }
+        )
+    return stdout
+
+
 def rand_str(len: int, seed: Any = None):
     """Generate a random string of specified length."""
-    old_state: object = None
-    if seed is not None:
-        old_state = random.getstate()
-        random.seed(seed)
-    result = "".join(random.choices(string.ascii_lowercase + string.digits, k=len))
-    if old_state is not None:
-        random.setstate(old_state)
-    return result
+    if seed is None:
+        # lowercased base32 only uses a-z and 2-7, so this stays within the seeded alphabet
+        return base64.b32encode(os.urandom((len * 5 + 7) // 8)).decode("ascii")[:len].lower()
+    # A seeded generator of its own gives the same output as seeding the global one,
+    # without saving/restoring the global state or racing other threads using it
+    return "".join(random.Random(seed).choices(_RAND_ALPHABET, k=len))
 
 
 def read_file(file_path: StrPath):
@@ -82,18 +239,142 @@ def read_file(file_path: StrPath):
 
 
 def extract_zip(archive: Path, dest_dir: Path):
-    """Extract a ZIP archive to destination directory."""
-    return run_process("unzip", "-o", str(archive), "-d", str(dest_dir))
+    """
+    Extract a ZIP archive to destination directory, overwriting existing files.
+
+    Unix permissions and symlinks stored in the archive are restored (zipfile alone
+    drops both), and macOS metadata (__MACOSX, AppleDouble "._" files) is skipped.
+    """
+    dest_root = dest_dir.resolve()
+
+    def member_path(name: str) -> Path:
+        # same sanitizing as zipfile: no absolute paths or parent references
+        path = dest_dir.joinpath(*(p for p in name.split("/") if p not in ("", ".", "..")))
+        # a symlink already on disk could still lead the member out of dest_dir
+        if not path.parent.resolve().is_relative_to(dest_root):
+            raise Exception(f"{name} in {archive} would be extracted outside {dest_dir}")
+        return path
+
+    links = []
+    with zipfile.ZipFile(archive) as z:
+        for info in z.infolist():
+            name = info.filename
+            if name.startswith("__MACOSX/") or os.path.basename(name.rstrip("/")).startswith("._"):
+                continue
+            path = member_path(name)
+            mode = info.external_attr >> 16
+            if stat.S_ISLNK(mode):
+                links.append((name, z.read(info).decode("utf-8")))
+                continue
+            z.extract(info, dest_dir)
+            if mode and not info.is_dir():
+                os.chmod(path, stat.S_IMODE(mode))
+
+    # like unzip, create symlinks last so no member is ever written through one
+    for name, target in links:
+        link = member_path(name)
+        link.parent.mkdir(parents=True, exist_ok=True)
+        if link.is_symlink() or link.is_file():
+            link.unlink()
+        elif link.is_dir():
+            shutil.rmtree(link)
+        os.symlink(target, link)
 
 
 def archive_zip(content_dir: Path, dest_file: Path):
-    """Create a ZIP archive from directory contents."""
-    return run_process("zip", "-r", str(dest_file.resolve()), ".", cwd=str(content_dir))
+    """
+    Create a ZIP archive from directory contents.
+
+    Entries are stored relative to content_dir with their Unix permissions; like
+    "zip -r", symlinks are followed and archived as the files they point to.
+    """
+    with zipfile.ZipFile(dest_file, "w", zipfile.ZIP_DEFLATED, compresslevel=ZIP_COMPRESS_LEVEL, strict_timestamps=False) as z:
+        for dir, dirs, files in os.walk(content_dir, followlinks=True):
+            dirs.sort()
+            rel_dir = os.path.relpath(dir, content_dir)
+            if rel_dir != ".":
+                z.write(dir, rel_dir)
+            for name in sorted(files):
+                z.write(os.path.join(dir, name), os.path.normpath(os.path.join(rel_dir, name)))
+
+
+def _tar_extractall(t: tarfile.TarFile, dest_dir: Path):
+    """Extract all members of an open tarfile."""
+    # the "tar" filter keeps absolute symlinks (fixed up by extract_deb), unlike "data"
+    t.extractall(dest_dir, **({"filter": "tar"} if hasattr(tarfile, "tar_filter") else {}))
 
 
 def extract_tar(archive: Path, dest_dir: Path):
-    """Extract a TAR archive to destination directory."""
-    return run_process("tar", "-x", "-f", str(archive), "-C" + str(dest_dir))
+    """Extract a (possibly compressed) TAR archive to destination directory."""
+    try:
+        with tarfile.open(archive, mode="r:*") as t:
+            _tar_extractall(t, dest_dir)
+    except (tarfile.ReadError, tarfile.CompressionError):
+        # e.g. zstd compressed data, which tarfile cannot read but bsdtar can
+        run_process("tar", "-x", "-f", str(archive), "-C" + str(dest_dir))
+
+
+class _BoundedReader:
+    """Read-only file view limited to a byte range of an underlying file."""
+
+    def __init__(self, f, size: int):
+        self.f = f
+        self.remaining = size
+
+    def read(self, n: int = -1) -> bytes:
+        if n < 0 or n > self.remaining:
+            n = self.remaining
+        data = self.f.read(n)
+        self.remaining -= len(data)
+        return data
+
+
+def ar_members(f) -> Iterator[Tuple[str, int]]:
+    """
+    Iterate over the members of an ar archive (such as a .deb) opened in binary mode.
+
+    Yields (name, size) with the file positioned at the start of the member's data;
+    the position is advanced to the next member when iteration continues.
+    """
+    if f.read(8) != b"!<arch>\n":
+        raise Exception("Not an ar archive")
+    while True:
+        header = f.read(60)
+        if len(header) < 60:
+            return
+        name = header[:16].decode("ascii").rstrip()
+        size = int(header[48:58])
+        start = f.tell()
+        if name.startswith("#1/"):
+            # BSD long name, stored at the start of the data
+            name_len = int(name[3:])
+            name = f.read(name_len).decode("utf-8").rstrip("\0")
+            yield name, size - name_len
+        else:
+            yield name.rstrip("/"), size
+        # member data is padded to an even size
+        f.seek(start + size + size % 2)
+
+
+def extract_deb_data(archive: Path, dest_dir: Path):
+    """Extract the data.tar.* member of a .deb package to destination directory without intermediate files."""
+    with open(archive, "rb") as f:
+        for name, size in ar_members(f):
+            if not name.startswith("data.tar"):
+                continue
+            start = f.tell()
+            try:
+                with tarfile.open(fileobj=_BoundedReader(f, size), mode="r|*") as t:
+                    _tar_extractall(t, dest_dir)
+            except (tarfile.ReadError, tarfile.CompressionError):
+                # e.g. zstd compressed data, which tarfile cannot read; hand it to tar instead
+                f.seek(start)
+                with tempfile.TemporaryDirectory() as tmpdir_str:
+                    data_tar = Path(tmpdir_str).joinpath(name)
+                    data_tar.write_bytes(f.read(size))
+                    run_process("tar", "-x", "-f", str(data_tar), "-C" + str(dest_dir))
+            return
+    raise Exception(f"No data archive found in {archive}")
 
 
 def print_object(obj: Any):
@@ -102,26 +383,61 @@ def print_object(obj: Any):
 
 
 def plutil_convert(plist: Path):
-    """Convert plist to XML format using plutil."""
+    """Convert plist to XML format, using plutil only for formats plistlib cannot read."""
+    data = plist.read_bytes()
+    if data.startswith(b"bplist00"):
+        return plistlib.dumps(plistlib.loads(data, fmt=plistlib.FMT_BINARY), fmt=plistlib.FMT_XML)
+    if data.lstrip().startswith(b"<"):
+        return data
     return run_process("plutil", "-convert", "xml1", "-o", "-", str(plist), capture=True).stdout
 
 
-def plist_load(plist: Path):
-    """Load a plist file."""
-    return plistlib.loads(plutil_convert(plist))
+# Parsed plist files by absolute path, with the (mtime, size) of the file they were parsed from
+_plist_cache: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+
+
+def _plist_parse(plist: Path):
+    """Parse a plist file."""
+    try:
+        # plistlib reads binary and XML plists itself
+        return plistlib.loads(plist.read_bytes())
+    except plistlib.InvalidFileException:
+        # other formats (e.g. old-style ASCII plists) still need plutil
+        return plistlib.loads(plutil_convert(plist))
+
+
+def plist_load(plist: Path, readonly: bool = False):
+    """
+    Load a plist file, parsing it again only when it changed since it was last loaded.
+
+    The result is a copy callers may modify. With readonly=True the cached parse itself
+    is returned, skipping the copy; it must not be modified.
+    """
+    key = os.path.abspath(plist)
+    st = os.stat(key)
+    cached = _plist_cache.get(key)
+    if cached is None or cached[0] != (st.st_mtime_ns, st.st_size):
+        cached = _plist_cache[key] = ((st.st_mtime_ns, st.st_size), _plist_parse(Path(key)))
+    return cached[1] if readonly else copy.deepcopy(cached[1])
 
 
-def plist_loads(plist: str) -> Any:
-    """Load plist from string."""
-    with tempfile.NamedTemporaryFile(suffix=".plist", mode="w") as f:
-        f.write(plist)
-        f.flush()
-        return plist_load(Path(f.name))
+def plist_loads(plist: Union[str, bytes]) -> Any:
+    """Load plist from string, or from bytes as read from a file or process output."""
+    try:
+        return plistlib.loads(plist.encode() if isinstance(plist, str) else plist)
+    except plistlib.InvalidFileException:
+        with tempfile.NamedTemporaryFile(suffix=".plist", mode="w" if isinstance(plist, str) else "wb") as f:
+            f.write(plist)
+            f.flush()
+            return plistlib.loads(plutil_convert(Path(f.name)))
 
 
-def plist_dump(data: Any, f):
-    """Dump data to plist format."""
-    return plistlib.dump(data, f)
+def plist_dump(data: Any, f, fmt: plistlib.PlistFormat = plistlib.FMT_BINARY):
+    """Dump data to plist format, binary unless another format is requested."""
+    # don't rely on mtime alone to spot the rewrite of a cached file on coarse-grained filesystems
+    if isinstance(getattr(f, "name", None), str):
+        _plist_cache.pop(os.path.abspath(f.name), None)
+    return plistlib.dump(data, f, fmt=fmt)
 
 
 def file_is_type(file: Path, type: str):
@@ -129,19 +445,76 @@ def file_is_type(file: Path, type: str):
     return type in decode_clean(run_process("file", str(file)).stdout)
 
 
+def _otool_arch_header(line: str) -> Optional[str]:
+    """Get the binary path from a "<path> (architecture X):" line that starts each slice of a fat binary."""
+    if line.endswith("):"):
+        path, sep, _ = line.rpartition(" (architecture ")
+        if sep:
+            return path
+    return None
+
+
+def _parse_otool_imports(output: List[str]):
+    """Parse the import lines (without the header) of "otool -L" output."""
+    # fat binaries list the imports of each slice under its own architecture header
+    output = [line for line in output if _otool_arch_header(line) is None]
+    # every line reads "<install name> (compatibility version X, current version Y)"
+    parts = [line.strip().rpartition(" (compatibility version ") for line in output]
+    results = [name.rstrip() for name, sep, _ in parts if sep]
+    if len(output) != len(results):
+        raise Exception("Failed to parse imports", {"output": output, "parsed": results})
+    # slices usually share their imports, so each one is listed once, in first-seen order
+    return list(dict.fromkeys(results))
+
+
 def get_otool_imports(binary: Path):
     """Get library imports from a binary using otool."""
     output = decode_clean(run_process("otool", "-L", str(binary)).stdout).splitlines()[1:]
-    matches = [re.search(r"(.+)\s\(.+\)", line.strip()) for line in output]
-    results = [match.group(1) for match in matches if match]
-    if len(output) != len(results):
-        raise Exception("Failed to parse imports", {"output": output, "parsed": results})
-    return results
+    return _parse_otool_imports(output)
+
+
+def get_otool_imports_bulk(binaries: Collection[Path]) -> Dict[Path, List[str]]:
+    """Get library imports of several binaries with a single otool call."""
+    if not binaries:
+        return {}
+    # each binary's section starts with a "<path>:" header at column 0, or for a fat binary,
+    # with one "<path> (architecture X):" header per slice
+    paths = {str(binary): binary for binary in binaries}
+    sections: Dict[Path, List[str]] = {}
+    output = None
+    for line in decode_clean(run_process("otool", "-L", *map(str, binaries)).stdout).splitlines():
+        binary = paths.get(line[:-1]) if line.endswith(":") else None
+        if binary is None:
+            binary = paths.get(_otool_arch_header(line))
+        if binary is not None:
+            output = sections.setdefault(binary, [])
+        elif output is None:
+            raise Exception("Failed to parse imports", {"line": line})
+        else:
+            output.append(line)
+    return {binary: _parse_otool_imports(output) for binary, output in sections.items()}
+
+
+def map_binaries(fn: Callable[[Any], Any], items: Iterable[Any], workers: Optional[int] = None) -> List[Any]:
+    """
+    Apply fn to each item from a thread pool, returning the results in order.
+
+    Meant for per-binary tool runs (otool, install_name_tool, ...): threads wait on their
+    own subprocess without holding the GIL, so independent binaries are processed in parallel.
+    """
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        return list(executor.map(fn, items))
 
 
 def install_name_change(binary: Path, old: Path, new: Path, capture: bool = True):
     """Change install name in binary using install_name_tool."""
-    return run_process("install_name_tool", "-change", str(old), str(new), str(binary), capture=capture)
+    return install_name_changes(binary, [(old, new)], capture)
+
+
+def install_name_changes(binary: Path, changes: List[Tuple[Path, Path]], capture: bool = True):
+    """Change several install names in binary with a single install_name_tool call."""
+    args = [arg for old, new in changes for arg in ("-change", str(old), str(new))]
+    return run_process("install_name_tool", *args, str(binary), capture=capture)
 
 
 def insert_dylib(binary: Path, path: Path, capture: bool = True):
@@ -151,21 +524,89 @@ def insert_dylib(binary: Path, path: Path, capture: bool = True):
     )
 
 
+def is_macho(file: Path) -> bool:
+    """Check if file is a (thin or fat) Mach-O binary by its magic bytes."""
+    # like "file", report symlinks as links rather than following them
+    if file.is_symlink() or not file.is_file():
+        return False
+    with open(file, "rb") as f:
+        return f.read(4) in MACHO_MAGICS
+
+
 def get_binary_map(dir: Path):
     """Get a mapping of binary names to their paths in a directory."""
-    return {file.name: file for file in safe_glob(dir, "**/*") if file_is_type(file, "Mach-O")}
+    files = list(walk_files(dir))
+    # probe the files from several threads so their reads overlap on a cold cache
+    with ThreadPoolExecutor(max_workers=BINARY_PROBE_WORKERS) as executor:
+        binaries = [file for file, ok in zip(files, executor.map(is_macho, files, chunksize=32)) if ok]
+    binary_map: Dict[str, Path] = {}
+    for file in binaries:
+        # when several binaries share a name, keep the last in path order so the pick does not vary between runs
+        if file.name not in binary_map or file > binary_map[file.name]:
+            binary_map[file.name] = file
+    return binary_map
+
 
+# Runs of characters the Developer Portal does not accept in names
+_NON_ALNUM_RE = re.compile("[^0-9a-zA-Z]+")
 
+
+@lru_cache(maxsize=256)
 def clean_dev_portal_name(name: str):
     """Clean a name for use in Apple Developer Portal."""
-    return re.sub("[^0-9a-zA-Z]+", " ", name).strip()
+    return _NON_ALNUM_RE.sub(" ", name).strip()
+
 
+def binary_replace_all(f: Path, replacements: Dict[str, str]) -> int:
+    """
+    Replace every occurrence of the given strings in a binary file, in a single pass.
 
-def binary_replace(pattern: str, f: Path):
-    """Replace patterns in binary file using perl."""
+    When every replacement has the same length as the string it replaces, the file is
+    memory-mapped and patched in place so only the pages with matches are written.
+    Otherwise the file is rewritten in full. At any position the longest matching key
+    wins. Returns the number of replacements made.
+    """
     if not f.exists() or not f.is_file():
         raise Exception(f, "does not exist or is a directory")
-    return run_process("perl", "-p", "-i", "-e", pattern, str(f))
+    patches = {k.encode(): v.encode() for k, v in replacements.items()}
+    if not patches or f.stat().st_size == 0:
+        return 0
+
+    # the regex engine tries alternatives in order, so sort longest first
+    pattern = re.compile(b"|".join(re.escape(k) for k in sorted(patches, key=len, reverse=True)))
+
+    if any(len(old) != len(new) for old, new in patches.items()):
+        data, count = pattern.subn(lambda m: patches[m.group()], f.read_bytes())
+        if count:
+            _plist_cache.pop(os.path.abspath(f), None)
+            f.write_bytes(data)
+        return count
+
+    # most targets contain none of the keys; find that out through a read-only
+    # mapping and only open the file for writing once there is something to patch
+    with open(f, "rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        first = pattern.search(mm)
+    if first is None:
+        return 0
+
+    # patching in place can leave mtime and size as they were
+    _plist_cache.pop(os.path.abspath(f), None)
+    count = 0
+    with open(f, "r+b") as fp, mmap.mmap(fp.fileno(), 0) as mm:
+        for match in pattern.finditer(mm, first.start()):
+            mm[match.start():match.end()] = patches[match.group()]
+            count += 1
+        mm.flush()
+    return count
+
+
+def link_or_copy(src: Path, dest: Path):
+    """Hard link src to dest, replacing dest; falls back to copying when linking isn't possible (e.g. across filesystems)."""
+    dest.unlink(missing_ok=True)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
 
 
 def move_merge_replace(src: Path, dest_dir: Path):
@@ -174,6 +615,18 @@ def move_merge_replace(src: Path, dest_dir: Path):
     if src == dest:
         return
     dest_dir.mkdir(exist_ok=True, parents=True)
+    if src.is_dir() and dest.is_dir():
+        # merge entry by entry so that each can still be renamed into place
+        for child in list(src.iterdir()):
+            move_merge_replace(child, dest)
+        src.rmdir()
+        return
+    try:
+        # a rename is all it takes within a filesystem (e.g. between temp dirs)
+        os.replace(src, dest)
+        return
+    except OSError:
+        pass
     if src.is_dir():
         shutil.copytree(src, dest, dirs_exist_ok=True)
         shutil.rmtree(src)
@@ -182,19 +635,25 @@ def move_merge_replace(src: Path, dest_dir: Path):
         os.remove(src)
 
 def popen_check(pipe: subprocess.Popen):
-    """Check if a subprocess completed successfully."""
+    """Wait for a subprocess and check if it completed successfully."""
+    # communicate drains stdout and stderr together, so a chatty process can't block on a full pipe
+    stdout, stderr = pipe.communicate()
     if pipe.returncode != 0:
         data = {"message": f"{pipe.args} failed with status code {pipe.returncode}"}
-        if pipe.stdout:
-            data["stdout"] = decode_clean(pipe.stdout.read())
-        if pipe.stderr:
-            data["stderr"] = decode_clean(pipe.stderr.read())
+        if stdout:
+            data["stdout"] = decode_clean(stdout)
+        if stderr:
+            data["stderr"] = decode_clean(stderr)
         raise Exception(data)
 
 
 def get_info_plist_path(app_dir: Path):
     """Get the Info.plist path for an app directory."""
-    return min(list(safe_glob(app_dir, "**/Info.plist")), key=lambda p: len(str(p)))
+    # iOS bundles keep it at the top level, macOS bundles in Contents
+    for info_plist in (app_dir.joinpath("Info.plist"), app_dir.joinpath("Contents", "Info.plist")):
+        if info_plist.is_file():
+            return info_plist
+    return min(safe_glob(app_dir, "**/Info.plist"), key=lambda p: (len(str(p)), p))
 
 # get to know if this app is iOS app, apple watch app, apple tv app, etc.
 def get_app_type(app_dir: Path):
@@ -227,7 +686,7 @@ def get_app_type(app_dir: Path):
             return "macos"
 
         # Load and analyze Info.plist
-        info = plist_load(info_plist_path)
+        info = plist_load(info_plist_path, readonly=True)
 
         # Check CFBundleSupportedPlatforms (most reliable when present)
         supported_platforms = info.get("CFBundleSupportedPlatforms", [])
@@ -280,9 +739,37 @@ def get_app_type(app_dir: Path):
         # Fallback to iOS as it's the most common case
         return "ios"
 
+
+# Main app found for each searched directory; tweak injection, the signer and get_app_type all look it up
+_main_app_paths: Dict[str, Path] = {}
+
+
 def get_main_app_path(app_dir: Path):
-    """Get the main .app path in a directory."""
-    return min(list(safe_glob(app_dir, "**/*.app")), key=lambda p: len(str(p)))
+    """Get the main .app path in a directory, remembering it for later lookups while it still exists."""
+    main_app = _main_app_paths.get(str(app_dir))
+    if main_app is None or not main_app.is_dir():
+        main_app = _main_app_paths[str(app_dir)] = _find_main_app_path(app_dir)
+    return main_app
+
+
+def _find_main_app_path(app_dir: Path):
+    """Find the main .app path in a directory, searching level by level so nested apps are never visited."""
+    level = [str(app_dir)]
+    while level:
+        apps, next_level = [], []
+        for dir in level:
+            with os.scandir(dir) as it:
+                for entry in it:
+                    if entry.name.startswith("._") or entry.name in IGNORED_NAMES:
+                        continue
+                    if entry.name.endswith(".app"):
+                        apps.append(entry.path)
+                    elif entry.is_dir(follow_symlinks=False):
+                        next_level.append(entry.path)
+        if apps:
+            return Path(min(sorted(apps), key=len))
+        level = next_level
+    raise Exception(f"No .app found in {app_dir}")
 
 def get_or_create_bundle_id(job_id: str, app_type: str) -> str:
     """Get existing bundle ID mapping or create new one for account."""
@@ -293,15 +780,18 @@ def get_or_create_bundle_id(job_id: str, app_type: str) -> str:
 
     return new_bundle_id
 
+# Bundle id suffixes by extension type
+_EXTENSION_TYPE_SUFFIXES = {
+    "today_extension": "widget",
+    "share_extension": "share",
+    "action_extension": "action",
+    "photo_extension": "photo",
+    "keyboard_extension": "keyboard",
+    "notification_extension": "notification",
+    "app_extension": "extension"
+}
+
+
 def get_extension_suffix(extension_type: str) -> str:
     """Get appropriate suffix for extension type."""
-    extension_suffixes = {
-        "today_extension": "widget",
-        "share_extension": "share",
-        "action_extension": "action",
-        "photo_extension": "photo",
-        "keyboard_extension": "keyboard",
-        "notification_extension": "notification",
-        "app_extension": "extension"
-    }
-    return extension_suffixes.get(extension_type, "extension")
+    return _EXTENSION_TYPE_SUFFIXES.get(extension_type, "extension")
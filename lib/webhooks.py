@@ -8,14 +8,132 @@ job status updates, and certificate/profile status reporting.
 
 import os
 import json
-from typing import Dict, Any, Optional
+import atexit
+import hashlib
+import http.client
+import queue
+import subprocess
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from functools import cache, lru_cache
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 from .utils import run_process, decode_clean
 
-# Environment variables for API communication
-secret_url = os.path.expandvars("$SECRET_URL").strip().rstrip("/")
-secret_key = os.path.expandvars("$SECRET_KEY")
-api_token = os.path.expandvars("$API_TOKEN")
-job_id = os.path.expandvars("$JOB_ID")
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The settings secret_url, secret_key, api_token and job_id resolve through the module
+# __getattr__ and are not exported; import them by name or read them off the module
+__all__ = [  # noqa: RUF022 - grouped by topic like the package __all__, not sorted
+    # Settings
+    'check_settings',
+
+    # Requests
+    'json_dumps', 'json_loads', 'webhook_request', 'curl_with_auth',
+
+    # Job status
+    'report_progress', 'flush_progress', 'flush_background_writes',
+    'complete_job', 'fail_job', 'get_job_info',
+
+    # Certificates, profiles and bundle ids
+    'get_certificate_from_server', 'get_certificate_info', 'upload_certificate', 'store_certificate_info',
+    'upload_provisioning_profile', 'get_bundle_id_mapping', 'store_app_capabilities',
+
+    # Signed IPA upload
+    'initiate_ipa_upload', 'upload_file_to_s3', 'complete_signed_ipa_upload', 'upload_signed_ipa',
+
+    # Unsigned IPA download
+    'download_file_from_s3',
+]
+
+def json_dumps(data: Any) -> bytes:
+    """Serialize data to JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode()
+
+
+def json_loads(data: bytes) -> Any:
+    """Parse JSON from bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Environment variables for API communication, read on first use and exposed as module attributes
+_ENV_VARS = {
+    "secret_url": "SECRET_URL",
+    "secret_key": "SECRET_KEY",
+    "api_token": "API_TOKEN",
+    "job_id": "JOB_ID",
+}
+
+
+@cache
+def _env(name: str) -> str:
+    """Get an API setting from the environment; unset variables are empty."""
+    value = os.environ.get(_ENV_VARS[name], "")
+    return value.strip().rstrip("/") if name == "secret_url" else value
+
+
+def check_settings():
+    """Raise if a setting every job needs is missing from the environment."""
+    missing = [_ENV_VARS[name] for name in ("secret_url", "api_token", "job_id") if not _env(name)]
+    if missing:
+        raise Exception(f"Missing required environment variables: {', '.join(missing)}")
+
+
+def __getattr__(name: str) -> str:
+    # keeps "from lib.webhooks import job_id" and friends working
+    if name in _ENV_VARS:
+        return _env(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Seconds to wait for the webhook server to accept a connection or send more of its response
+WEBHOOK_TIMEOUT = 10
+
+# curl options for the big S3 transfers: give up on an unreachable host quickly, and on a transfer
+# that stalls below 1 KB/s for a minute, without capping how long a healthy transfer may take
+CURL_TRANSFER_TIMEOUTS = ("--connect-timeout", "10", "--speed-limit", "1024", "--speed-time", "60")
+
+# S3 transfers are streamed in chunks of this size, on connections that give up
+# when S3 stops sending or accepting data for this many seconds
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+S3_TRANSFER_TIMEOUT = 60
+
+# The unsigned IPA is downloaded as up to this many byte ranges at once, none smaller than
+# the minimum part size, since a single S3 connection is limited well below the runner's bandwidth
+DOWNLOAD_PARTS = 8
+DOWNLOAD_MIN_PART_SIZE = 8 * 1024 * 1024
+
+# Gateway errors are usually a server restart or deploy in progress, so these are retried after a short wait
+WEBHOOK_RETRY_STATUSES = frozenset({502, 503, 504})
+WEBHOOK_RETRY_DELAYS = (0.2, 0.4, 0.8)
+
+# Webhook requests share one keep-alive connection, so only the first pays for the TCP and TLS handshakes
+_webhook_conn: Optional[http.client.HTTPConnection] = None
+_webhook_lock = threading.Lock()
+
+# Successful lookups, so repeated questions within a job don't cost another round trip
+_bundle_id_cache: Dict[Tuple[str, str], Any] = {}
+_certificate_cache: Dict[Tuple[str, Tuple[str, ...]], Any] = {}
+
+# Progress reports waiting to be sent by the background reporter thread
+_progress_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+_progress_thread: Optional[threading.Thread] = None
+_progress_thread_lock = threading.Lock()
+# How long exit waits for unsent progress reports, so a hung server can't keep the process alive
+PROGRESS_EXIT_TIMEOUT = 5
+
+# Write-only webhooks that nothing waits on are sent from a background thread, in order
+_background_writer: Optional[ThreadPoolExecutor] = None
+_background_writes: List[Future] = []
+_background_writer_lock = threading.Lock()
 
 def curl_with_auth(
     url: str,
@@ -38,7 +156,7 @@ def curl_with_auth(
     return run_process(
         "curl",
         *["-S", "-f", "-L", "-H"],
-        f"Authorization: Bearer {secret_key}",
+        f"Authorization: Bearer {_env('secret_key')}",
         *args,
         url,
         check=check,
@@ -46,49 +164,146 @@ def curl_with_auth(
     )
 
 
+def _open_connection(url: urllib.parse.SplitResult, timeout: float, **kwargs) -> http.client.HTTPConnection:
+    """Create an HTTP or HTTPS connection to the host of a split URL."""
+    conn_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+    return conn_class(url.netloc, timeout=timeout, **kwargs)
+
+
+def _get_webhook_connection() -> http.client.HTTPConnection:
+    """Get the shared connection to the webhook server, creating it on first use."""
+    global _webhook_conn
+    if _webhook_conn is None:
+        _webhook_conn = _open_connection(urllib.parse.urlsplit(_env("secret_url")), WEBHOOK_TIMEOUT)
+    return _webhook_conn
+
+
+@lru_cache(maxsize=64)
+def _webhook_url(endpoint: str) -> Tuple[str, str]:
+    """Get the full URL of a webhook endpoint and its path on the server."""
+    url = f"{_env('secret_url')}/api/v1/webhook/{endpoint}"
+    return url, urllib.parse.urlsplit(url).path
+
+
+@cache
+def _webhook_headers() -> Dict[str, str]:
+    """Get the headers sent with every webhook request; shared, so callers must not modify it."""
+    return {"Content-Type": "application/json", "X-API-Token": _env("api_token")}
+
+
 def webhook_request(
     endpoint: str,
     data: Dict[str, Any],
     method: str = "POST",
     check: bool = True,
-):
-    """Make authenticated webhook request to server."""
-    url = f"{secret_url}/api/v1/webhook/{endpoint}"
-    json_data = json.dumps(data)
+) -> subprocess.CompletedProcess:
+    """
+    Make authenticated webhook request to server.
 
-    return run_process(
-        "curl",
-        "-X", method,
-        "-H", "Content-Type: application/json",
-        "-H", f"X-API-Token: {api_token}",
-        "-d", json_data,
-        url,
-        check=check,
-        capture=True,
-    )
+    Like the curl call this replaces, HTTP error statuses are not failures; only a request
+    that gets no response raises (or, with check=False, returns a non-zero returncode).
+    Gateway errors are retried a few times first. The response body is returned as stdout.
+    """
+    url, path = _webhook_url(endpoint)
+    body = json_dumps(data)
+    headers = _webhook_headers()
+
+    with _webhook_lock:
+        conn = _get_webhook_connection()
+        try:
+            for delay in (*WEBHOOK_RETRY_DELAYS, None):
+                try:
+                    conn.request(method, path, body, headers)
+                    response = conn.getresponse()
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    # the server dropped the idle keep-alive connection, so reconnect and send it again
+                    conn.close()
+                    conn.request(method, path, body, headers)
+                    response = conn.getresponse()
+                stdout = response.read()
+                if response.status not in WEBHOOK_RETRY_STATUSES or delay is None:
+                    break
+                print(f"Webhook {endpoint} returned HTTP {response.status}, retrying in {delay}s")
+                time.sleep(delay)
+        except (http.client.HTTPException, OSError) as e:
+            conn.close()
+            if check:
+                raise Exception({"url": url, "error": str(e)}) from e
+            return subprocess.CompletedProcess(url, 1, b"", str(e).encode())
+
+    return subprocess.CompletedProcess(url, 0, stdout, b"")
+
+
+def _send_progress():
+    """Send queued progress reports to the server, in order, for the lifetime of the process."""
+    while True:
+        data = _progress_queue.get()
+        # each report supersedes the ones before it, so when several piled up only send the newest
+        skipped = 0
+        while True:
+            try:
+                data = _progress_queue.get_nowait()
+                skipped += 1
+            except queue.Empty:
+                break
+        try:
+            webhook_request("job/progress", data)
+            print(f"Progress reported: {data['progress']}% - {data['message']}")
+        except Exception as e:
+            print(f"Failed to report progress: {e}")
+        finally:
+            for _ in range(skipped + 1):
+                _progress_queue.task_done()
+
+
+def flush_progress(timeout: Optional[float] = None) -> bool:
+    """Wait until every queued progress report has been sent; False if the timeout ran out first."""
+    with _progress_queue.all_tasks_done:
+        return _progress_queue.all_tasks_done.wait_for(lambda: not _progress_queue.unfinished_tasks, timeout)
 
 
 def report_progress(progress: int, message: str = "", state: int = 1):
-    """Report job progress to server."""
-    try:
-        webhook_request("job/progress", {
-            "job_id": job_id,
-            "progress": progress,
-            "state": state,
-            "message": message
-        })
-        print(f"Progress reported: {progress}% - {message}")
-    except Exception as e:
-        print(f"Failed to report progress: {e}")
+    """Queue a job progress report; it is sent in the background so signing does not wait on the server."""
+    global _progress_thread
+    with _progress_thread_lock:
+        if _progress_thread is None:
+            _progress_thread = threading.Thread(target=_send_progress, name="progress-reporter", daemon=True)
+            _progress_thread.start()
+            atexit.register(flush_progress, PROGRESS_EXIT_TIMEOUT)
+    _progress_queue.put_nowait({
+        "job_id": _env("job_id"),
+        "progress": progress,
+        "state": state,
+        "message": message
+    })
+
+
+def _write_in_background(write: Callable[[], None]):
+    """Run a webhook write on the background writer thread; the write reports its own errors."""
+    global _background_writer
+    with _background_writer_lock:
+        if _background_writer is None:
+            _background_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webhook-writer")
+        _background_writes[:] = [future for future in _background_writes if not future.done()]
+        _background_writes.append(_background_writer.submit(write))
+
+
+def flush_background_writes(timeout: Optional[float] = None) -> bool:
+    """Wait until every background webhook write has been sent; False if the timeout ran out first."""
+    with _background_writer_lock:
+        pending = list(_background_writes)
+    return not wait(pending, timeout).not_done
 
 
 def get_certificate_from_server(account_id: str) -> Optional[Dict[str, Any]]:
     """Get existing certificate from server."""
+    # a certificate stored in the background must reach the server before it is asked for
+    flush_background_writes()
     try:
         result = webhook_request("certificate/get", {
             "account_id": account_id
         })
-        response_data = json.loads(decode_clean(result.stdout))
+        response_data = json_loads(result.stdout)
 
         if response_data.get("code") == 1:
             print("Certificate found on server")
@@ -107,6 +322,7 @@ def upload_certificate(account_id: str, team_id: str, certificate_data: str):
             "team_id": team_id,
             "certificate_data": certificate_data
         })
+        _forget_certificates(account_id)
         print(f"Certificate uploaded successfully for account {account_id}")
     except Exception as e:
         print(f"Failed to upload certificate: {e}")
@@ -117,7 +333,7 @@ def upload_provisioning_profile(account_id: str, bundle_id: str, device_udid: st
     """Upload provisioning profile to server."""
     try:
         webhook_request("profile/store", {
-            "job_id": job_id,
+            "job_id": _env("job_id"),
             "bundle_id": bundle_id,
             "profile_data": profile_data,
             "profile_id": profile_id,
@@ -133,8 +349,11 @@ def complete_job(output_path: str):
     """Mark job as completed."""
     try:
         print("Marking job as completed...")
+        # the server should see every progress report and stored result before the job ends
+        flush_background_writes()
+        flush_progress()
         webhook_request("job/complete", {
-            "job_id": job_id,
+            "job_id": _env("job_id"),
             "output_path": output_path,
         })
         print("Job marked as completed")
@@ -145,8 +364,10 @@ def complete_job(output_path: str):
 def fail_job(error_message: str, error_details: str = ""):
     """Mark job as failed."""
     try:
+        flush_background_writes()
+        flush_progress()
         webhook_request("job/fail", {
-            "job_id": job_id,
+            "job_id": _env("job_id"),
             "message": error_message,
             "error_details": error_details
         })
@@ -158,8 +379,8 @@ def fail_job(error_message: str, error_details: str = ""):
 def get_job_info():
     """Get comprehensive job information from server."""
     try:
-        result = webhook_request("job/start", {"job_id": job_id})
-        response_data = json.loads(decode_clean(result.stdout))
+        result = webhook_request("job/start", {"job_id": _env("job_id")})
+        response_data = json_loads(result.stdout)
 
         if response_data.get("code") != 1:
             raise Exception(f"Failed to get job info: {response_data.get('message', 'Unknown error')}")
@@ -169,17 +390,27 @@ def get_job_info():
         print(f"Failed to get job info: {e}")
         raise
 
+def _forget_certificates(account_id: str):
+    """Drop cached certificate lookups for an account after its certificate changed on the server."""
+    for key in [key for key in _certificate_cache if key[0] == account_id]:
+        del _certificate_cache[key]
+
+
 def get_bundle_id_mapping(job_id: str, app_type: str):
     """Get existing bundle ID mapping for an account and original bundle ID."""
+    key = (job_id, app_type)
+    if key in _bundle_id_cache:
+        return _bundle_id_cache[key]
     try:
         result = webhook_request("bundle/get", {
             "job_id": job_id,
             "app_type": app_type
         })
-        response_data = json.loads(decode_clean(result.stdout))
+        response_data = json_loads(result.stdout)
 
         if response_data.get("code") == 1:
-            return response_data.get("data", {}).get("mapped_bundle_id")
+            mapped_bundle_id = _bundle_id_cache[key] = response_data.get("data", {}).get("mapped_bundle_id")
+            return mapped_bundle_id
         return None
     except Exception as e:
         print(f"Failed to get bundle ID mapping: {e}")
@@ -188,15 +419,21 @@ def get_bundle_id_mapping(job_id: str, app_type: str):
 
 def get_certificate_info(account_id: str, capabilities: list):
     """Get existing certificate for account with required capabilities."""
+    key = (account_id, tuple(sorted(capabilities)))
+    if key in _certificate_cache:
+        return _certificate_cache[key]
+    # a certificate stored in the background must reach the server before it is asked for
+    flush_background_writes()
     try:
         result = webhook_request("certificate/get", {
             "account_id": account_id,
             "capabilities": capabilities
         })
-        response_data = json.loads(decode_clean(result.stdout))
+        response_data = json_loads(result.stdout)
 
         if response_data.get("code") == 1:
-            return response_data.get("data")
+            certificate = _certificate_cache[key] = response_data.get("data")
+            return certificate
         return None
     except Exception as e:
         print(f"Failed to get certificate info: {e}")
@@ -204,33 +441,45 @@ def get_certificate_info(account_id: str, capabilities: list):
 
 
 def store_certificate_info(account_id: str, certificate_data: str, capabilities: list, team_id: str):
-    """Store certificate information for reuse."""
-    try:
-        webhook_request("certificate/store", {
-            "account_id": account_id,
-            "certificate_data": certificate_data,
-            "capabilities": capabilities,
-            "team_id": team_id,
-            "job_id": job_id
-        })
-        print(f"Certificate stored for account {account_id} with {len(capabilities)} capabilities")
-    except Exception as e:
-        print(f"Failed to store certificate: {e}")
+    """Store certificate information for reuse, without waiting for the server."""
+    data = {
+        "account_id": account_id,
+        "certificate_data": certificate_data,
+        "capabilities": capabilities,
+        "team_id": team_id,
+        "job_id": _env("job_id")
+    }
+
+    def store():
+        try:
+            webhook_request("certificate/store", data)
+            print(f"Certificate stored for account {account_id} with {len(capabilities)} capabilities")
+        except Exception as e:
+            print(f"Failed to store certificate: {e}")
+
+    # lookups from now on go to the server, which they reach only after this store
+    _forget_certificates(account_id)
+    _write_in_background(store)
 
 
 def store_app_capabilities(account_id: str, bundle_id: str, capabilities: list, entitlements: dict):
-    """Store app capabilities and entitlements for analysis."""
-    try:
-        webhook_request("app/capabilities", {
-            "account_id": account_id,
-            "bundle_id": bundle_id,
-            "capabilities": capabilities,
-            "entitlements": entitlements,
-            "job_id": job_id
-        })
-        print(f"App capabilities stored for {bundle_id}: {len(capabilities)} capabilities")
-    except Exception as e:
-        print(f"Failed to store app capabilities: {e}")
+    """Store app capabilities and entitlements for analysis, without waiting for the server."""
+    data = {
+        "account_id": account_id,
+        "bundle_id": bundle_id,
+        "capabilities": capabilities,
+        "entitlements": entitlements,
+        "job_id": _env("job_id")
+    }
+
+    def store():
+        try:
+            webhook_request("app/capabilities", data)
+            print(f"App capabilities stored for {bundle_id}: {len(capabilities)} capabilities")
+        except Exception as e:
+            print(f"Failed to store app capabilities: {e}")
+
+    _write_in_background(store)
 
 
 def initiate_ipa_upload() -> Optional[Dict[str, Any]]:
@@ -246,7 +495,7 @@ def initiate_ipa_upload() -> Optional[Dict[str, Any]]:
     """
     try:
         result = webhook_request("ipa/upload/initiate", {})
-        response_data = json.loads(decode_clean(result.stdout))
+        response_data = json_loads(result.stdout)
 
         if response_data.get("code") == 1:
             print("✓ Received upload URL from server")
@@ -259,38 +508,84 @@ def initiate_ipa_upload() -> Optional[Dict[str, Any]]:
         return None
 
 
-def upload_file_to_s3(file_path: str, upload_url: str) -> bool:
+def _read_upload_chunks(f, size: int, digest=None) -> Iterator[bytes]:
+    """Read an upload body in chunks, hashing it into digest and printing how far along it is every 10%."""
+    sent = 0
+    next_report = 10
+    for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+        sent += len(chunk)
+        if digest is not None:
+            digest.update(chunk)
+        yield chunk
+        percent = sent * 100 // size
+        if percent >= next_report:
+            print(f"Uploaded {percent}% ({sent / (1024*1024):.2f} MB)")
+            next_report = percent - percent % 10 + 10
+
+
+def _upload_file_with_curl(file_path: str, upload_url: str):
+    """PUT a file with curl, for comparing against the built-in upload when debugging."""
+    # -X PUT: Use PUT HTTP method (required for S3 uploads)
+    # -T: Upload file from this path
+    # --progress-bar: Show a nice progress indicator
+    run_process(
+        "curl",
+        "-X", "PUT",
+        "-T", str(file_path),
+        "-H", "Content-Type: application/octet-stream",
+        "--progress-bar",
+        *CURL_TRANSFER_TIMEOUTS,
+        upload_url,
+        check=True,
+        capture=False  # Let curl show progress to console
+    )
+
+
+def upload_file_to_s3(file_path: str, upload_url: str, digest=None) -> bool:
     """
     Step 2: Upload the file directly to S3 using the pre-signed URL.
 
     This is like actually delivering the package to the address we got earlier.
-    We use a PUT request (which means "store this file here") with curl.
+    We use a PUT request (which means "store this file here"), streaming the file
+    from disk so it never has to fit in memory. Set SIGN_CURL_UPLOAD=1 to upload
+    with curl instead.
 
     Args:
         file_path: Path to the signed IPA file on disk
         upload_url: The pre-signed URL from step 1
+        digest: Optional hashlib object to update with the uploaded bytes, so the
+            checksum is computed in the same pass that reads the file
 
     Returns:
         True if upload succeeded, False otherwise
     """
     try:
+        size = os.path.getsize(file_path)
         print(f"Uploading file: {file_path}")
-        print(f"File size: {os.path.getsize(file_path) / (1024*1024):.2f} MB")
-
-        # Use curl to upload the file with PUT method
-        # -X PUT: Use PUT HTTP method (required for S3 uploads)
-        # -T: Upload file from this path
-        # --progress-bar: Show a nice progress indicator
-        result = run_process(
-            "curl",
-            "-X", "PUT",
-            "-T", str(file_path),
-            "-H", "Content-Type: application/octet-stream",
-            "--progress-bar",
-            upload_url,
-            check=True,
-            capture=False  # Let curl show progress to console
-        )
+        print(f"File size: {size / (1024*1024):.2f} MB")
+
+        if os.environ.get("SIGN_CURL_UPLOAD") == "1":
+            _upload_file_with_curl(file_path, upload_url)
+            if digest is not None:
+                with open(file_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                        digest.update(chunk)
+        else:
+            url = urllib.parse.urlsplit(upload_url)
+            path = _request_path(url)
+            conn = _open_connection(url, S3_TRANSFER_TIMEOUT)
+            try:
+                with open(file_path, "rb") as f:
+                    conn.request("PUT", path, _read_upload_chunks(f, size, digest), {
+                        "Content-Type": "application/octet-stream",
+                        "Content-Length": str(size),
+                    })
+                response = conn.getresponse()
+                body = response.read()
+            finally:
+                conn.close()
+            if response.status >= 300:
+                raise Exception({"status": response.status, "body": decode_clean(body)})
 
         print("✓ File uploaded successfully to S3")
         return True
@@ -299,26 +594,109 @@ def upload_file_to_s3(file_path: str, upload_url: str) -> bool:
         return False
 
 
-def complete_signed_ipa_upload(s3_key: str) -> bool:
+def _request_path(url: urllib.parse.SplitResult) -> str:
+    """Get the path and query of a split URL, as sent in the request line."""
+    path = url.path or "/"
+    if url.query:
+        path += "?" + url.query
+    return path
+
+
+def _get_download_size(url: urllib.parse.SplitResult) -> Optional[int]:
+    """Get the size of a download, or None if the server can't send byte ranges of it."""
+    conn = _open_connection(url, S3_TRANSFER_TIMEOUT)
+    try:
+        # a one-byte range rather than HEAD, which a pre-signed GET URL is not valid for
+        conn.request("GET", _request_path(url), headers={"Range": "bytes=0-0"})
+        response = conn.getresponse()
+        if response.status == 206:
+            response.read()
+    finally:
+        # anything else may be the whole file, so close the connection instead of reading it
+        conn.close()
+    content_range = response.getheader("Content-Range", "")
+    if response.status != 206 or not content_range.startswith("bytes 0-0/"):
+        return None
+    size = content_range.rpartition("/")[2]
+    return int(size) if size.isdigit() else None
+
+
+def _download_range(url: urllib.parse.SplitResult, fd: int, start: int, end: int):
+    """Download bytes start to end (inclusive) of a URL into the same offsets of an open file."""
+    conn = _open_connection(url, S3_TRANSFER_TIMEOUT)
+    try:
+        conn.request("GET", _request_path(url), headers={"Range": f"bytes={start}-{end}"})
+        response = conn.getresponse()
+        if response.status != 206:
+            raise Exception({"status": response.status, "range": (start, end), "body": decode_clean(response.read())})
+        offset = start
+        for chunk in iter(lambda: response.read(UPLOAD_CHUNK_SIZE), b""):
+            os.pwrite(fd, chunk, offset)
+            offset += len(chunk)
+    finally:
+        conn.close()
+    if offset != end + 1:
+        raise Exception({"error": "incomplete download", "range": (start, end), "received": offset - start})
+
+
+def download_file_from_s3(download_url: str, file_path: str):
+    """
+    Download a file, such as the unsigned IPA, from S3.
+
+    Large files are fetched as several byte ranges over parallel connections and
+    written straight into place. Servers that don't support ranges, and URLs that
+    aren't plain HTTP(S), fall back to a single curl download.
+    """
+    url = urllib.parse.urlsplit(download_url)
+    size = _get_download_size(url) if url.scheme in ("http", "https") else None
+    if not size:
+        run_process("curl", "-L", *CURL_TRANSFER_TIMEOUTS, "-o", str(file_path), download_url)
+        return
+
+    parts = max(1, min(DOWNLOAD_PARTS, size // DOWNLOAD_MIN_PART_SIZE))
+    part_size = -(-size // parts)
+    ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+    print(f"Downloading {size / (1024*1024):.2f} MB in {len(ranges)} parts")
+
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, size)
+        with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="download") as executor:
+            for future in [executor.submit(_download_range, url, fd, start, end) for start, end in ranges]:
+                future.result()
+    finally:
+        os.close(fd)
+
+
+def complete_signed_ipa_upload(s3_key: str, size: Optional[int] = None, sha256: Optional[str] = None) -> bool:
     """
     Step 3: Notify the server that the upload is complete.
 
     This is like confirming with the server that "Hey, I've delivered the package
     to the address you gave me, it's there now!" The server will then verify
-    the file exists and update the database.
+    the file exists and update the database. The size and SHA-256 checksum, when
+    given, let the server check that it received the whole file intact.
 
     Args:
         s3_key: The S3 key from step 1 (where the file was stored)
+        size: Size of the uploaded file in bytes
+        sha256: Hex SHA-256 digest of the uploaded file
 
     Returns:
         True if completion was successful, False otherwise
     """
+    data = {
+        "s3_key": s3_key,
+        "job_id": _env("job_id")
+    }
+    if size is not None:
+        data["size"] = size
+    if sha256 is not None:
+        data["sha256"] = sha256
+
     try:
-        result = webhook_request("ipa/upload/complete", {
-            "s3_key": s3_key,
-            "job_id": job_id
-        })
-        response_data = json.loads(decode_clean(result.stdout))
+        result = webhook_request("ipa/upload/complete", data)
+        response_data = json_loads(result.stdout)
 
         if response_data.get("code") == 1:
             print("✓ Upload completion confirmed by server")
@@ -365,14 +743,16 @@ def upload_signed_ipa(file_path: str) -> bool:
     # Step 2: Upload file to S3
     print("Step 2/3: Uploading file to S3...")
     report_progress(85, "Uploading signed IPA to storage")
-    if not upload_file_to_s3(file_path, upload_url):
+    digest = hashlib.sha256()
+    if not upload_file_to_s3(file_path, upload_url, digest):
         print("✗ Failed to upload file")
         return False
+    print(f"SHA-256: {digest.hexdigest()}")
 
     # Step 3: Complete the upload
     print("Step 3/3: Confirming upload with server...")
     report_progress(90, "Confirming upload completion")
-    if not complete_signed_ipa_upload(s3_key):
+    if not complete_signed_ipa_upload(s3_key, os.path.getsize(file_path), digest.hexdigest()):
         print("✗ Failed to complete upload")
         return False
 
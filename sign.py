@@ -29,8 +29,9 @@ from lib import (
     inject_tweaks,
     upload_signed_ipa
 )
-from lib.utils import extract_zip, archive_zip, run_process
-from lib.webhooks import job_id, api_token
+from lib.utils import extract_zip, archive_zip
+from lib import webhooks
+from lib.webhooks import check_settings, download_file_from_s3
 import aes
 
 def run(job_data, account_data, keychain_name):
@@ -46,20 +47,16 @@ def run(job_data, account_data, keychain_name):
 
     # Use account data from job info
     prov_profile = Path("prov.mobileprovision")
-    account_name_file = Path("account_name.txt")
-    account_pass_file = Path("account_pass.txt")
     bundle_name = Path("bundle_name.txt")
 
-    # Write account data from server
+    # Account credentials from the server are kept in memory, never written to disk
     if account_data and account_data.get("email") and account_data.get("password"):
-        with open(account_name_file, "w") as f:
-            f.write(account_data["email"])
+        account_name = account_data["email"]
         # Handle encrypted password - decode base64 if it looks encoded
         password = account_data["password"]
         if password and len(password) > 10 and password.endswith("=="):
             try:
-                from lib.webhooks import secret_key
-                decrypted_password = aes.decrypt_aes_cbc_pkcs7(password, secret_key)
+                decrypted_password = aes.decrypt_aes_cbc_pkcs7(password, webhooks.secret_key)
                 print("Decoded base64 password")
             except Exception as e:
                 print(f"Failed to decode password, using as-is: {e}")
@@ -67,8 +64,6 @@ def run(job_data, account_data, keychain_name):
         else:
             decrypted_password = password
 
-        with open(account_pass_file, "w") as f:
-            f.write(decrypted_password)
         print("Using developer account from server")
     else:
         raise Exception("Developer account information required but not found in job data.")
@@ -101,8 +96,8 @@ def run(job_data, account_data, keychain_name):
                 temp_dir,
                 common_name,
                 team_id,
-                read_file(account_name_file) if account_name_file.is_file() else "",
-                read_file(account_pass_file) if account_pass_file.is_file() else "",
+                account_name,
+                decrypted_password,
                 prov_profile if prov_profile.is_file() else None,
                 user_bundle_id,
                 read_file(bundle_name) if bundle_name.exists() else None,
@@ -114,7 +109,7 @@ def run(job_data, account_data, keychain_name):
                 False, # patch_ids
                 False, # force_original_id
                 account_id,  # account_id for bundle ID management
-                job_id,  # job_id for bundle ID management
+                webhooks.job_id,  # job_id for bundle ID management
                 device_udid,  # device_udid for provisioning profile
                 keychain_name,  # keychain_name for certificate storage
             )
@@ -141,16 +136,14 @@ def run(job_data, account_data, keychain_name):
 
 def main():
     """Main entry point for the signing tool."""
-    # Job ID should be provided as environment variable
-    if not job_id:
-        print("ERROR: JOB_ID environment variable is required")
-        sys.exit(1)
-
-    if not api_token:
-        print("ERROR: API_TOKEN environment variable is required")
+    # The job and server settings are provided as environment variables
+    try:
+        check_settings()
+    except Exception as e:
+        print(f"ERROR: {e}")
         sys.exit(1)
 
-    print(f"Processing job: {job_id}")
+    print(f"Processing job: {webhooks.job_id}")
 
     # Get job information from server - no more legacy file dependencies
     try:
@@ -176,7 +169,7 @@ def main():
     try:
        # Direct S3 URL - download directly
         print(f"Downloading from S3 URL: {input_path}")
-        run_process("curl", "-L", "-o", str(unsigned_ipa), input_path)
+        download_file_from_s3(input_path, str(unsigned_ipa))
     except Exception as e:
         error_msg = f"Failed to download unsigned IPA: {e}"
         print(error_msg)
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import subprocess
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lib import fastlane_integration
+
+# The prompts fastlane spaceauth prints when it needs a code, ending without a newline like fastlane's
+TRUSTED_DEVICE_PROMPT = """\
+Two-factor Authentication (6 digits) is enabled for account 'user@example.com'
+More information about Two-factor Authentication: https://support.apple.com/HT204915
+
+(Input `sms` to escape this prompt and select a trusted phone number to send the code as a text message)
+
+Please enter the 6 digit code:"""
+
+SMS_PROMPT = """\
+Successfully requested text message to +1 (•••) •••-••12
+Please enter the 6 digit code you received at +1 (•••) •••-••12:"""
+
+TWO_STEP_PROMPT = """\
+Two-step Verification (4 digits code) is enabled for account 'user@example.com'
+Please enter the 4 digit code:"""
+
+# Logs in when it reads the expected code on stdin, like spaceauth after a prompt
+FAKE_FASTLANE = """\
+#!/bin/sh
+printf '%s' "$FAKE_PROMPT"
+read code
+[ "$code" = "123456" ] && echo "Successfully logged in" && exit 0
+exit 1
+"""
+
+
+class RegisterAppsTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+        async def run_process_aio(*cmd, **kwargs):
+            self.calls.append(cmd[2:])
+            await asyncio.sleep(0)
+            return b""
+
+        patcher = mock.patch.object(fastlane_integration, "run_process_aio", run_process_aio)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_shared_extras_are_created_once(self):
+        entitlements = {
+            "com.apple.security.application-groups": ["group.com.example.app"],
+            "com.apple.developer.icloud-container-identifiers": ["iCloud.com.example.app"],
+        }
+        fastlane_integration.fastlane_register_apps("user", "pass", "TEAM", [
+            ("com.example.app", entitlements),
+            ("com.example.app.widget", entitlements),
+            ("com.example.app.share", entitlements),
+        ])
+
+        creates = [call for call in self.calls if call[0] in ("group", "cloud_container")]
+        self.assertCountEqual(creates, [
+            ("group", "--skip_itc", "-g", "group.com.example.app", "-n", "ST group com example app"),
+            ("cloud_container", "--skip_itc", "-g", "iCloud.com.example.app", "-n", "ST iCloud com example app"),
+        ])
+
+        associates = [i for i, call in enumerate(self.calls) if call[0].startswith("associate_")]
+        self.assertEqual(len(associates), 6)
+        self.assertGreater(min(associates), max(self.calls.index(call) for call in creates))
+
+
+class FastlaneAuthTest(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        fastlane = Path(tmpdir.name, "fastlane")
+        fastlane.write_text(FAKE_FASTLANE)
+        fastlane.chmod(0o755)
+
+        self.requests = []
+
+        def webhook_request(endpoint, data, check=True):
+            self.requests.append(endpoint)
+            body = b'{"code": 1, "data": {"two_factor_code": "123456"}}'
+            return subprocess.CompletedProcess(endpoint, 0, body, b"")
+
+        for patcher in (
+            mock.patch.dict(os.environ, {"PATH": tmpdir.name + os.pathsep + os.environ["PATH"]}),
+            mock.patch.object(fastlane_integration, "webhook_request", webhook_request),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        fastlane_integration._build_fastlane_env.cache_clear()
+        self.addCleanup(fastlane_integration._build_fastlane_env.cache_clear)
+
+    def auth(self, prompt: str) -> float:
+        with mock.patch.dict(os.environ, {"FAKE_PROMPT": prompt}):
+            start = time.time()
+            fastlane_integration.fastlane_auth("user@example.com", "pass", "TEAM")
+            return time.time() - start
+
+    def test_recognized_prompts(self):
+        for prompt in (TRUSTED_DEVICE_PROMPT, SMS_PROMPT, TWO_STEP_PROMPT):
+            with self.subTest(prompt=prompt.splitlines()[-1]):
+                self.assertRegex(prompt.encode(), fastlane_integration.TWO_FACTOR_PROMPT)
+                with mock.patch.object(fastlane_integration, "TWO_FACTOR_FALLBACK_DELAY", 60):
+                    self.assertLess(self.auth(prompt), 5)
+                self.assertEqual(self.requests.pop(), "job/2fa")
+
+    def test_unrecognized_prompt_falls_back_to_polling(self):
+        with mock.patch.object(fastlane_integration, "TWO_FACTOR_FALLBACK_DELAY", 1):
+            self.auth("Enter the verification code sent to your devices:")
+        self.assertEqual(self.requests, ["job/2fa"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import subprocess
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lib import utils
+
+THIN_OUTPUT = """\
+/tmp/tweak/Tweak.dylib:
+\t/Library/MobileSubstrate/DynamicLibraries/Tweak.dylib (compatibility version 1.0.0, current version 1.0.0)
+\t/Library/Frameworks/CydiaSubstrate.framework/CydiaSubstrate (compatibility version 0.0.0, current version 0.0.0)
+\t/usr/lib/libobjc.A.dylib (compatibility version 1.0.0, current version 228.0.0)
+"""
+
+FAT_OUTPUT = """\
+/tmp/tweak/Tweak.dylib (architecture arm64):
+\t/Library/MobileSubstrate/DynamicLibraries/Tweak.dylib (compatibility version 1.0.0, current version 1.0.0)
+\t/Library/Frameworks/CydiaSubstrate.framework/CydiaSubstrate (compatibility version 0.0.0, current version 0.0.0)
+\t/usr/lib/libobjc.A.dylib (compatibility version 1.0.0, current version 228.0.0)
+/tmp/tweak/Tweak.dylib (architecture arm64e):
+\t/Library/MobileSubstrate/DynamicLibraries/Tweak.dylib (compatibility version 1.0.0, current version 1.0.0)
+\t/Library/Frameworks/CydiaSubstrate.framework/CydiaSubstrate (compatibility version 0.0.0, current version 0.0.0)
+\t/usr/lib/libobjc.A.dylib (compatibility version 1.0.0, current version 228.0.0)
+\t/usr/lib/libc++.1.dylib (compatibility version 1.0.0, current version 1300.23.0)
+"""
+
+PREFS_OUTPUT = """\
+/tmp/tweak/Prefs (architecture arm64):
+\t/Library/PreferenceBundles/Prefs.bundle/Prefs (compatibility version 1.0.0, current version 1.0.0)
+\t/usr/lib/libSystem.B.dylib (compatibility version 1.0.0, current version 1311.0.0)
+/tmp/tweak/Prefs (architecture arm64e):
+\t/Library/PreferenceBundles/Prefs.bundle/Prefs (compatibility version 1.0.0, current version 1.0.0)
+\t/usr/lib/libSystem.B.dylib (compatibility version 1.0.0, current version 1311.0.0)
+"""
+
+TWEAK_IMPORTS = [
+    "/Library/MobileSubstrate/DynamicLibraries/Tweak.dylib",
+    "/Library/Frameworks/CydiaSubstrate.framework/CydiaSubstrate",
+    "/usr/lib/libobjc.A.dylib",
+]
+
+PREFS_IMPORTS = ["/Library/PreferenceBundles/Prefs.bundle/Prefs", "/usr/lib/libSystem.B.dylib"]
+
+
+def otool_result(stdout: str):
+    return mock.patch.object(
+        utils, "run_process", return_value=subprocess.CompletedProcess([], 0, stdout.encode(), b"")
+    )
+
+
+class GetOtoolImportsTest(unittest.TestCase):
+    def test_thin_binary(self):
+        with otool_result(THIN_OUTPUT):
+            self.assertEqual(utils.get_otool_imports(Path("/tmp/tweak/Tweak.dylib")), TWEAK_IMPORTS)
+
+    def test_fat_binary(self):
+        with otool_result(FAT_OUTPUT):
+            self.assertEqual(
+                utils.get_otool_imports(Path("/tmp/tweak/Tweak.dylib")),
+                TWEAK_IMPORTS + ["/usr/lib/libc++.1.dylib"],
+            )
+
+    def test_unparsable_line(self):
+        with otool_result(THIN_OUTPUT + "\tgarbage\n"), self.assertRaisesRegex(Exception, "Failed to parse imports"):
+            utils.get_otool_imports(Path("/tmp/tweak/Tweak.dylib"))
+
+
+class GetOtoolImportsBulkTest(unittest.TestCase):
+    def test_fat_and_thin_binaries(self):
+        tweak = Path("/tmp/tweak/Tweak.dylib")
+        prefs = Path("/tmp/tweak/Prefs")
+        with otool_result(PREFS_OUTPUT + THIN_OUTPUT):
+            self.assertEqual(utils.get_otool_imports_bulk([tweak, prefs]), {
+                prefs: PREFS_IMPORTS,
+                tweak: TWEAK_IMPORTS,
+            })
+
+    def test_fat_binaries(self):
+        tweak = Path("/tmp/tweak/Tweak.dylib")
+        prefs = Path("/tmp/tweak/Prefs")
+        with otool_result(FAT_OUTPUT + PREFS_OUTPUT):
+            imports = utils.get_otool_imports_bulk([tweak, prefs])
+        self.assertEqual(imports[tweak], TWEAK_IMPORTS + ["/usr/lib/libc++.1.dylib"])
+        self.assertEqual(imports[prefs], PREFS_IMPORTS)
+
+    def test_output_before_header(self):
+        output = "\t/usr/lib/libobjc.A.dylib (compatibility version 1.0.0, current version 228.0.0)\n"
+        with otool_result(output), self.assertRaisesRegex(Exception, "Failed to parse imports"):
+            utils.get_otool_imports_bulk([Path("/tmp/tweak/Tweak.dylib")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import plistlib
+import tempfile
+import unittest
+from pathlib import Path
+
+from lib import utils
+
+
+class PlistLoadTest(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.plist = Path(tmpdir.name, "Info.plist")
+        self.plist.write_bytes(plistlib.dumps({"CFBundleIdentifier": "com.example.app"}))
+
+    def test_readonly_loads_share_the_parse(self):
+        info = utils.plist_load(self.plist, readonly=True)
+        self.assertIs(utils.plist_load(self.plist, readonly=True), info)
+        self.assertIsNot(utils.plist_load(self.plist), info)
+
+    def test_dump_invalidates_the_written_file(self):
+        info = utils.plist_load(self.plist)
+        info["CFBundleIdentifier"] = "com.example.other"
+        with self.plist.open("wb") as f:
+            utils.plist_dump(info, f)
+        self.assertEqual(utils.plist_load(self.plist, readonly=True)["CFBundleIdentifier"], "com.example.other")
+
+    def test_binary_patch_invalidates_the_file(self):
+        for new_id in ("com.example.ppa", "com.example.app.patched"):
+            with self.subTest(new_id=new_id):
+                old_id = utils.plist_load(self.plist, readonly=True)["CFBundleIdentifier"]
+                st = self.plist.stat()
+                self.assertEqual(utils.binary_replace_all(self.plist, {old_id: new_id}), 1)
+                # as on a filesystem whose timestamps are too coarse to tell the write apart
+                os.utime(self.plist, ns=(st.st_atime_ns, st.st_mtime_ns))
+                self.assertEqual(utils.plist_load(self.plist, readonly=True)["CFBundleIdentifier"], new_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import stat
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+from lib import utils
+
+
+class ExtractZipTest(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmp = Path(tmpdir.name)
+        self.archive = self.tmp / "app.ipa"
+        self.dest = self.tmp / "dest"
+        self.dest.mkdir()
+
+    def write_archive(self, entries):
+        with zipfile.ZipFile(self.archive, "w") as z:
+            for name, data, mode in entries:
+                info = zipfile.ZipInfo(name)
+                info.external_attr = mode << 16
+                z.writestr(info, data)
+
+    def test_permissions_and_symlinks(self):
+        self.write_archive([
+            ("Payload/App.app/App", b"binary", stat.S_IFREG | 0o755),
+            ("Payload/App.app/Current", "App", stat.S_IFLNK | 0o777),
+            ("__MACOSX/Payload/._App.app", b"", stat.S_IFREG | 0o644),
+        ])
+        utils.extract_zip(self.archive, self.dest)
+
+        app = self.dest / "Payload/App.app"
+        self.assertEqual(stat.S_IMODE((app / "App").stat().st_mode), 0o755)
+        self.assertEqual((app / "Current").readlink(), Path("App"))
+        self.assertFalse((self.dest / "__MACOSX").exists())
+
+    def test_member_behind_symlink_stays_inside(self):
+        out = self.tmp / "out"
+        out.mkdir()
+        self.write_archive([
+            ("Payload/link", str(out), stat.S_IFLNK | 0o777),
+            ("Payload/link/evil.txt", b"evil", stat.S_IFREG | 0o644),
+        ])
+        utils.extract_zip(self.archive, self.dest)
+
+        self.assertEqual(list(out.iterdir()), [])
+        self.assertEqual((self.dest / "Payload/link").readlink(), out)
+
+    def test_member_through_existing_symlink_is_rejected(self):
+        out = self.tmp / "out"
+        out.mkdir()
+        (self.dest / "Payload").mkdir()
+        (self.dest / "Payload/link").symlink_to(out)
+        self.write_archive([("Payload/link/evil.txt", b"evil", stat.S_IFREG | 0o644)])
+
+        with self.assertRaisesRegex(Exception, "would be extracted outside"):
+            utils.extract_zip(self.archive, self.dest)
+        self.assertEqual(list(out.iterdir()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()